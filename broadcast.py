@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Iterable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import Message
+
+from mirrorhub.config import (
+    BROADCAST_RATE_PER_TOKEN,
+    BROADCAST_WORKERS_PER_TOKEN,
+    BROADCAST_PROGRESS_EVERY,
+    BROADCAST_PAGE_SIZE,
+    BROADCAST_LANE_QUEUE,
+    BROADCAST_OVERFLOW_MAX,
+    USER_READMIT_AFTER_DAYS,
+    USER_READMIT_INTERVAL,
+)
+from mirrorhub.core.db import AsyncSessionLocal
+from mirrorhub.core.arepo import count_audience, get_audience_page, readmit_users
+from mirrorhub.core.write_behind import bookkeeping
+from mirrorhub.http_pool import make_bot
+from mirrorhub.media_cache import send_photo_cached
+from mirrorhub.send_limiter import retry_sink, send_priority, PRIORITY_BULK
+from mirrorhub.utils.rate_limit import TokenBucket
+
+log = logging.getLogger(__name__)
+
+# удалённые аккаунты и несуществующие чаты не возвращаются, заблокировавшие — могут
+_DEACTIVATED_ERRORS = ("user is deactivated",)
+_NOT_FOUND_ERRORS = ("chat not found", "user not found", "peer_id_invalid")
+READMIT_STATES = ("blocked",)
+
+
+@dataclass
+class BroadcastStats:
+    total: int = 0
+    ok: int = 0
+    fail: int = 0
+    retried: int = 0
+    unreachable: int = 0  # входят в fail; отмечены в bot_users и в следующие рассылки не попадут
+    started_at: float = 0.0
+
+    @property
+    def done(self) -> int:
+        return self.ok + self.fail
+
+
+def classify_delivery_error(exc: BaseException) -> str | None:
+    # -> blocked / deactivated / not_found — получатель недоступен; None — временная ошибка
+    err = str(exc).lower()
+    if any(e in err for e in _DEACTIVATED_ERRORS):
+        return "deactivated"
+    if isinstance(exc, TelegramForbiddenError):
+        # заблокировал бота или никогда его не запускал
+        return "blocked"
+    if isinstance(exc, TelegramBadRequest) and any(e in err for e in _NOT_FOUND_ERRORS):
+        return "not_found"
+    return None
+
+
+async def _send_one(bot: Bot, bucket: TokenBucket, chat_id: int, text: str, photo_path: str | None) -> str:
+    # -> ok / fail / состояние недоступного получателя (classify_delivery_error);
+    # лимиты Telegram и повтор после 429 — в send_limiter, здесь только темп рассылки
+    await bucket.acquire()
+    try:
+        if photo_path:
+            await send_photo_cached(bot, chat_id, photo_path, caption=text)
+        else:
+            await bot.send_message(chat_id=chat_id, text=text)
+        return "ok"
+    except Exception as e:
+        return classify_delivery_error(e) or "fail"
+
+
+@dataclass
+class PageTicket:
+    # страница аудитории: курсор можно сдвинуть на last_user_id, когда pending дойдёт до нуля;
+    # ok/fail — итоги страницы, сохраняются вместе с курсором
+    last_user_id: int
+    pending: int
+    ok: int = 0
+    fail: int = 0
+
+
+class TokenLane:
+    # Очередь одного токена: свои воркеры и лимиты. submit не блокирует: сверх очереди
+    # копится overflow, поэтому токен, переждающий 429, не тормозит раздачу остальным;
+    # общий предел памяти держит wait_overflow
+    def __init__(self, token: str, text: str, photo_path: str | None, stats: BroadcastStats,
+                 gate: asyncio.Event | None = None, bot_id: int | None = None, priority: int = PRIORITY_BULK):
+        self.bot = make_bot(token)
+        self.bot_id = bot_id  # чей это токен — для отметки недоступных в bot_users
+        self.bucket = TokenBucket(BROADCAST_RATE_PER_TOKEN)
+        self.gate = gate
+        self.priority = priority
+        self.queue: asyncio.Queue[tuple[int, PageTicket | None] | None] = asyncio.Queue(BROADCAST_LANE_QUEUE)
+        self.overflow: deque[tuple[int, PageTicket | None] | None] = deque()
+        self.workers = [
+            asyncio.create_task(self._worker(text, photo_path, stats)) for _ in range(BROADCAST_WORKERS_PER_TOKEN)
+        ]
+
+    async def _worker(self, text: str, photo_path: str | None, stats: BroadcastStats):
+        retry_sink.set(stats)
+        send_priority.set(self.priority)
+        while True:
+            item = await self.queue.get()
+            # пока есть запас, очередь держится полной — порядок не нарушается
+            if self.overflow:
+                self.queue.put_nowait(self.overflow.popleft())
+            if item is None:
+                return
+            chat_id, ticket = item
+            if self.gate is not None:
+                # пауза: воркеры досылают текущее и ждут
+                await self.gate.wait()
+            result = await _send_one(self.bot, self.bucket, chat_id, text, photo_path)
+            if result == "ok":
+                stats.ok += 1
+            else:
+                stats.fail += 1
+                if result != "fail":
+                    stats.unreachable += 1
+                    if self.bot_id is not None:
+                        bookkeeping.record_user_state(self.bot_id, chat_id, result)
+            if ticket is not None:
+                if result == "ok":
+                    ticket.ok += 1
+                else:
+                    ticket.fail += 1
+                ticket.pending -= 1
+
+    def submit(self, item: tuple[int, PageTicket | None] | None):
+        if self.overflow or self.queue.full():
+            self.overflow.append(item)
+        else:
+            self.queue.put_nowait(item)
+
+    async def close(self):
+        for _ in self.workers:
+            self.submit(None)
+        try:
+            await asyncio.gather(*self.workers)
+        finally:
+            await self.bot.session.close()
+
+    async def abort(self):
+        for w in self.workers:
+            w.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        await self.bot.session.close()
+
+
+async def wait_overflow(lanes: Iterable[TokenLane]):
+    # чтение аудитории встаёт, только когда отстающие токены накопили слишком много
+    while sum(len(lane.overflow) for lane in lanes) > BROADCAST_OVERFLOW_MAX:
+        await asyncio.sleep(0.1)
+
+
+async def iter_audience(
+    after: int = 0, page_size: int = BROADCAST_PAGE_SIZE,
+) -> AsyncIterator[list[tuple[int, int, str]]]:
+    # keyset по user_id: в памяти только текущая страница, сколько бы ни было bot_users
+    while True:
+        async with AsyncSessionLocal() as db:
+            page = await get_audience_page(db, after, page_size)
+        if not page:
+            return
+        yield page
+        after = page[-1][0]
+
+
+def render_progress(stats: BroadcastStats, finished: bool = False) -> str:
+    elapsed = max(time.monotonic() - stats.started_at, 0.001)
+    head = "✅ Рассылка завершена." if finished else "📣 Рассылка идёт…"
+    return (
+        f"{head}\n"
+        f"Отправлено: {stats.ok}/{stats.total}. Ошибок: {stats.fail}, "
+        f"из них заблокировали/удалились: {stats.unreachable}.\n"
+        f"Повторов из-за флуд-лимита: {stats.retried}\n"
+        f"Скорость: {stats.done / elapsed:.1f} сообщ./с, прошло {int(elapsed)} с"
+    )
+
+
+async def _edit_status(status: Message, text: str):
+    try:
+        await status.edit_text(text)
+    except Exception:
+        # "message is not modified" и т.п. — не критично
+        pass
+
+
+async def run_broadcast_stream(
+    pages: AsyncIterator[list[tuple[int, int, str]]],
+    text: str,
+    photo_path: str | None,
+    status: Message | None = None,
+    total: int = 0,
+    priority: int = PRIORITY_BULK,
+) -> BroadcastStats:
+    # pages: страницы (chat_id, bot_id, token); каждый токен получает свою очередь
+    stats = BroadcastStats(total=total, started_at=time.monotonic())
+    lanes: dict[int, TokenLane] = {}
+
+    async def progress_loop():
+        last = None
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_EVERY)
+            snapshot = (stats.ok, stats.fail, stats.retried)
+            if snapshot != last:
+                last = snapshot
+                await _edit_status(status, render_progress(stats))
+
+    progress = asyncio.create_task(progress_loop()) if status else None
+    try:
+        async for page in pages:
+            for chat_id, bot_id, token in page:
+                lane = lanes.get(bot_id)
+                if lane is None:
+                    lane = lanes[bot_id] = TokenLane(token, text, photo_path, stats, bot_id=bot_id, priority=priority)
+                if not total:
+                    stats.total += 1
+                lane.submit((chat_id, None))
+            await wait_overflow(lanes.values())
+        # все токены параллельно, у каждого свой лимит
+        await asyncio.gather(*(lane.close() for lane in lanes.values()))
+    except BaseException:
+        await asyncio.gather(*(lane.abort() for lane in lanes.values()))
+        raise
+    finally:
+        if progress:
+            progress.cancel()
+            try:
+                await progress
+            except asyncio.CancelledError:
+                pass
+
+    if status:
+        await _edit_status(status, render_progress(stats, finished=True))
+    return stats
+
+
+async def run_audience_broadcast(
+    text: str, photo_path: str | None, status: Message | None = None, priority: int = PRIORITY_BULK,
+) -> BroadcastStats:
+    # каждый человек получает ровно одно сообщение, через зеркало, с которым общался последним
+    async with AsyncSessionLocal() as db:
+        total = await count_audience(db)
+    return await run_broadcast_stream(iter_audience(), text, photo_path, status, total, priority)
+
+
+async def user_readmit_loop():
+    # раз в USER_READMIT_INTERVAL даём заблокировавшим ещё один шанс
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                n = await readmit_users(
+                    db, READMIT_STATES, datetime.utcnow() - timedelta(days=USER_READMIT_AFTER_DAYS),
+                )
+            if n:
+                log.info("Readmitted %s unreachable users to broadcast audience", n)
+        except Exception:
+            log.exception("User readmit failed")
+        await asyncio.sleep(USER_READMIT_INTERVAL)
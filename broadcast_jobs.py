@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from mirrorhub.config import BROADCAST_PROGRESS_EVERY, BROADCAST_INFLIGHT_PAGES
+from mirrorhub.core.db import AsyncSessionLocal
+from mirrorhub.core.arepo import (
+    count_audience, create_broadcast_job, get_broadcast_job, list_broadcast_jobs, update_broadcast_job,
+    add_broadcast_log,
+)
+from mirrorhub.broadcast import BroadcastStats, PageTicket, TokenLane, iter_audience, render_progress
+
+log = logging.getLogger(__name__)
+
+JOB_ACTIVE = ("queued", "running")
+JOB_UNFINISHED = ("queued", "running", "paused")
+
+
+def job_kb(job_id: int, status: str) -> InlineKeyboardMarkup | None:
+    kb = InlineKeyboardBuilder()
+    if status in JOB_ACTIVE:
+        kb.button(text="⏸ Пауза", callback_data=f"bj:pause:{job_id}")
+    elif status == "paused":
+        kb.button(text="▶️ Продолжить", callback_data=f"bj:resume:{job_id}")
+    else:
+        return None
+    kb.button(text="✖️ Отменить", callback_data=f"bj:cancel:{job_id}")
+    kb.adjust(2)
+    return kb.as_markup()
+
+
+def render_job(job_id: int, status: str, stats: BroadcastStats) -> str:
+    if status == "paused":
+        head = f"⏸ Рассылка #{job_id} на паузе."
+    elif status == "cancelled":
+        head = f"✖️ Рассылка #{job_id} отменена."
+    else:
+        head = f"Рассылка #{job_id}"
+    return f"{head}\n{render_progress(stats, finished=status == 'done')}"
+
+
+class BroadcastJobs:
+    # Рассылки живут в broadcast_jobs: курсор по user_id сохраняется по ходу,
+    # после рестарта незаконченные продолжаются с отметки, а не с начала.
+    def __init__(self):
+        self.bot: Bot | None = None  # центральный бот — правит статус-сообщения
+        self._tasks: dict[int, asyncio.Task] = {}
+        self._gates: dict[int, asyncio.Event] = {}
+        self._stats: dict[int, BroadcastStats] = {}
+
+    def bind(self, bot: Bot):
+        self.bot = bot
+
+    async def submit(self, text: str, photo_path: str | None, status_chat_id: int, status_message_id: int) -> int:
+        async with AsyncSessionLocal() as db:
+            total = await count_audience(db)
+            job = await create_broadcast_job(db, text, photo_path, total, status_chat_id, status_message_id)
+        self._spawn(job.id)
+        return job.id
+
+    async def resume_all(self) -> int:
+        async with AsyncSessionLocal() as db:
+            jobs = await list_broadcast_jobs(db, JOB_ACTIVE)
+        for job in jobs:
+            if job.id not in self._tasks:
+                log.info("Resuming broadcast job #%s from user_id > %s", job.id, job.cursor_user_id)
+                self._spawn(job.id)
+        return len(jobs)
+
+    async def pause(self, job_id: int) -> bool:
+        if not await self._set_status(job_id, JOB_ACTIVE, "paused"):
+            return False
+        gate = self._gates.get(job_id)
+        if gate:
+            gate.clear()
+        return True
+
+    async def resume(self, job_id: int) -> bool:
+        if not await self._set_status(job_id, ("paused",), "running"):
+            return False
+        if job_id in self._tasks:
+            self._gates[job_id].set()
+        else:
+            self._spawn(job_id)
+        return True
+
+    async def cancel(self, job_id: int) -> bool:
+        if not await self._set_status(job_id, JOB_UNFINISHED, "cancelled"):
+            return False
+        task = self._tasks.get(job_id)
+        if task:
+            # итоговый статус покажет сама задача, когда остановится
+            task.cancel()
+        return True
+
+    async def stop(self):
+        # рестарт процесса: статус остаётся running, курсор сохраняется — при старте продолжим
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _set_status(self, job_id: int, allowed: tuple[str, ...], status: str) -> bool:
+        async with AsyncSessionLocal() as db:
+            job = await get_broadcast_job(db, job_id)
+            if not job or job.status not in allowed:
+                return False
+            await update_broadcast_job(db, job_id, status=status)
+        if status != "cancelled" or job_id not in self._tasks:
+            await self._report(job_id)
+        return True
+
+    async def _report(self, job_id: int):
+        # статус берём из БД: тик прогресса не должен показать «идёт» у отменённой/приостановленной
+        if self.bot is None:
+            return
+        async with AsyncSessionLocal() as db:
+            job = await get_broadcast_job(db, job_id)
+        if not job or not job.status_chat_id:
+            return
+        status = job.status
+        stats = self._stats.get(job_id) or BroadcastStats(
+            total=job.total or 0, ok=job.ok or 0, fail=job.fail or 0, started_at=time.monotonic(),
+        )
+        try:
+            await self.bot.edit_message_text(
+                chat_id=job.status_chat_id,
+                message_id=job.status_message_id,
+                text=render_job(job_id, status, stats),
+                reply_markup=job_kb(job_id, status),
+            )
+        except Exception:
+            # "message is not modified" и т.п. — не критично
+            pass
+
+    def _spawn(self, job_id: int):
+        gate = self._gates.setdefault(job_id, asyncio.Event())
+        gate.set()
+        task = asyncio.create_task(self._run(job_id), name=f"broadcast-job-{job_id}")
+        self._tasks[job_id] = task
+
+        def _done(t: asyncio.Task):
+            if self._tasks.get(job_id) is t:
+                self._tasks.pop(job_id, None)
+                self._gates.pop(job_id, None)
+                self._stats.pop(job_id, None)
+            if not t.cancelled() and t.exception():
+                log.error("Broadcast job #%s failed", job_id, exc_info=t.exception())
+
+        task.add_done_callback(_done)
+
+    async def _run(self, job_id: int):
+        async with AsyncSessionLocal() as db:
+            job = await get_broadcast_job(db, job_id)
+            if not job or job.status not in JOB_ACTIVE:
+                return
+            await update_broadcast_job(db, job_id, status="running")
+        text, photo_path = job.text or "", job.photo_path
+        gate = self._gates[job_id]
+        stats = self._stats[job_id] = BroadcastStats(
+            total=job.total or 0, ok=job.ok or 0, fail=job.fail or 0, started_at=time.monotonic(),
+        )
+        cursor = job.cursor_user_id or 0
+        # в БД — только итоги страниц до курсора: после рестарта страницы за ним
+        # отправятся заново и посчитаются ещё раз
+        saved_ok, saved_fail = job.ok or 0, job.fail or 0
+        tickets: deque[PageTicket] = deque()
+        lanes: dict[int, TokenLane] = {}
+
+        def advance():
+            # курсор двигается только за полностью обработанными страницами
+            nonlocal cursor, saved_ok, saved_fail
+            while tickets and tickets[0].pending <= 0:
+                t = tickets.popleft()
+                cursor, saved_ok, saved_fail = t.last_user_id, saved_ok + t.ok, saved_fail + t.fail
+
+        async def checkpoint():
+            advance()
+            async with AsyncSessionLocal() as db:
+                await update_broadcast_job(db, job_id, cursor_user_id=cursor, ok=saved_ok, fail=saved_fail)
+
+        async def progress_loop():
+            while True:
+                await asyncio.sleep(BROADCAST_PROGRESS_EVERY)
+                await checkpoint()
+                await self._report(job_id)
+
+        progress = asyncio.create_task(progress_loop())
+        finished = False
+        try:
+            async for page in iter_audience(after=cursor):
+                await gate.wait()
+                # отстающий токен держит курсор: дальше окна не уходим, чтобы падение
+                # не отправило повторно десятки тысяч сообщений
+                advance()
+                while len(tickets) >= BROADCAST_INFLIGHT_PAGES:
+                    await asyncio.sleep(0.1)
+                    advance()
+                ticket = PageTicket(page[-1][0], len(page))
+                tickets.append(ticket)
+                for user_id, bot_id, token in page:
+                    lane = lanes.get(bot_id)
+                    if lane is None:
+                        lane = lanes[bot_id] = TokenLane(token, text, photo_path, stats, gate, bot_id)
+                    lane.submit((user_id, ticket))
+            await asyncio.gather(*(lane.close() for lane in lanes.values()))
+            finished = True
+        except BaseException:
+            await asyncio.gather(*(lane.abort() for lane in lanes.values()))
+            raise
+        finally:
+            progress.cancel()
+            await asyncio.gather(progress, return_exceptions=True)
+            # при отмене/рестарте тоже фиксируем, докуда дошли
+            await asyncio.shield(checkpoint())
+            if not finished:
+                # отмена/рестарт: последнее слово за сохранённым статусом
+                await asyncio.shield(self._report(job_id))
+
+        async with AsyncSessionLocal() as db:
+            await update_broadcast_job(db, job_id, status="done")
+            await add_broadcast_log(db, text, photo_path, stats.total, stats.ok, stats.fail)
+        await self._report(job_id)
+
+
+broadcast_jobs = BroadcastJobs()
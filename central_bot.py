@@ -1,27 +1,41 @@
 
 import asyncio
+import logging
 import re
-from typing import Dict
+import time
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.filters import Command, CommandObject
 from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.types import Message, CallbackQuery, FSInputFile, ReplyKeyboardRemove
 from mirrorhub.utils.keyboards import admin_menu_kb, bots_menu_kb, bot_row_kb, tokens_menu_kb, telethon_menu_kb, admin_reply_kb
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy import select
-from mirrorhub.core.models import Token, BotInstance
-from mirrorhub.config import CENTRAL_BOT_TOKEN, SUPERADMINS
-from mirrorhub.core.repo import (
+from mirrorhub.core.models import Token
+from mirrorhub.config import (
+    CENTRAL_BOT_TOKEN, SUPERADMINS, FLEET_OP_CONCURRENCY, FLEET_OP_TIMEOUT, FLEET_RESTORE_STAGGER,
+    STATS_APPROX,
+)
+from mirrorhub.core.arepo import (
     add_token, add_tokens_bulk, list_tokens, list_bots, create_bot_instance, get_bot_users,
-    add_broadcast_log, set_setting, get_setting, delete_bot_completely,
-    aggregate_stats, next_free_token, delete_tokens_by_ids, set_bot_running
+    delete_bot_completely, get_bot_token,
+    aggregate_stats, claim_tokens, delete_tokens_by_ids, set_bot_running,
+    get_total_users_range, get_user_counts_by_bot_range, get_starts_by_bot_range, list_broadcast_jobs,
+    count_unreachable_users,
 )
-from mirrorhub.core.db import SessionLocal
+from mirrorhub.core.db import AsyncSessionLocal
+from mirrorhub.core.settings_cache import settings
+from mirrorhub.core.write_behind import bookkeeping
 from mirrorhub.utils.keyboards import admin_menu_kb, bots_menu_kb, bot_row_kb, tokens_menu_kb
 from mirrorhub.telethon_manager import TelethonManager, OWNER_ID_SETTING
 from mirrorhub.mirror_runner import MirrorRunner
+from mirrorhub.media_cache import invalidate_photo, warm_fleet
+from mirrorhub.http_pool import render_pool_stats
+from mirrorhub.utils.rate_limit import TokenBucket
+from mirrorhub.broadcast_jobs import broadcast_jobs, job_kb, JOB_UNFINISHED
 
 RUNNERS: dict[int, MirrorRunner] = {}
+RESTORE_REPORT_KEY = "mirrors_restore_report"
 _WAITERS: Dict[int, asyncio.Future[Message]] = {}
 r = Router()
 
@@ -32,8 +46,7 @@ def admin_only():
             return False
         if m.from_user.id in SUPERADMINS:
             return True
-        with SessionLocal() as db:
-            owner = get_setting(db, OWNER_ID_SETTING)
+        owner = settings.get(OWNER_ID_SETTING)
         return owner is not None and str(m.from_user.id) == owner
     return _check
 
@@ -50,6 +63,10 @@ async def start_cmd(m: Message):
 async def ping_cmd(m: Message):
     await m.answer("pong")
 
+@r.message(Command("pool"), admin_only())
+async def pool_cmd(m: Message):
+    await m.answer(render_pool_stats())
+
 @r.message(Command("admin"), admin_only())
 async def admin_menu(m: Message):
     await m.answer("Выбери раздел:", reply_markup=admin_menu_kb())
@@ -83,8 +100,8 @@ async def wait_and_add_tokens(msg: Message):
     tokens = [ln for ln in lines if TOKEN_RE.match(ln)]
     if not tokens:
         return await msg.answer("Не нашёл валидных токенов в сообщении.")
-    with SessionLocal() as db:
-        added, skipped = add_tokens_bulk(db, tokens)
+    async with AsyncSessionLocal() as db:
+        added, skipped = await add_tokens_bulk(db, tokens)
     txt = f"Добавлено: {added}"
     if skipped:
         txt += f"\nПропущено (возможны дубли/ошибки): {len(skipped)}"
@@ -93,9 +110,9 @@ async def wait_and_add_tokens(msg: Message):
 @r.callback_query(F.data.in_(("adm:tokens", "tok:refresh")))
 async def cb_tokens(c: CallbackQuery):
 
-    with SessionLocal() as db:
-        toks = list_tokens(db)
-        used = {b.token_id: b for b in list_bots(db)}
+    async with AsyncSessionLocal() as db:
+        toks = await list_tokens(db)
+        used = {b.token_id: b for b in await list_bots(db)}
     if not toks:
         await c.message.answer("Токенов нет.", reply_markup=tokens_menu_kb())
         return await c.answer()
@@ -105,7 +122,10 @@ async def cb_tokens(c: CallbackQuery):
         used_by = f"used_by: #{b.id} @{b.username or '—'}" if b else "used_by: —"
         link = f" {b.link}" if b and b.link else ""
         note = f" | {t.note}" if t.note else ""
-        return f"#{t.id} • {t.status} | {used_by}{link} | created: {t.created_at:%Y-%m-%d %H:%M}{note}"
+        checked = f" | checked: {t.checked_at:%Y-%m-%d %H:%M}" if t.checked_at else ""
+        if not b and t.status == "verified" and t.username:
+            used_by = f"used_by: — (@{t.username})"
+        return f"#{t.id} • {t.status} | {used_by}{link} | created: {t.created_at:%Y-%m-%d %H:%M}{checked}{note}"
 
     CH = 30
     header = f"Всего: {len(toks)}"
@@ -132,8 +152,8 @@ async def wait_tok_delete(msg: Message):
             pass
     if not ids:
         return await msg.answer("Не нашёл ID.")
-    with SessionLocal() as db:
-        deleted, skipped = delete_tokens_by_ids(db, ids)
+    async with AsyncSessionLocal() as db:
+        deleted, skipped = await delete_tokens_by_ids(db, ids)
     txt = f"Удалено: {deleted}"
     if skipped:
         txt += f"\nПропущены (in_use): {', '.join(map(str, skipped))}"
@@ -147,8 +167,8 @@ async def cb_bots(c: CallbackQuery):
 
 @r.callback_query(F.data == "bots:list")
 async def cb_bots_list(c: CallbackQuery):
-    with SessionLocal() as db:
-        bots = list_bots(db)
+    async with AsyncSessionLocal() as db:
+        bots = await list_bots(db)
     if not bots:
         await c.message.answer("Ботов нет.")
         return await c.answer()
@@ -157,49 +177,107 @@ async def cb_bots_list(c: CallbackQuery):
         state = "🟢" if b.is_running else "🔴"
         text = f"{state} #{b.id} @{b.username or '—'} {b.link or ''}\n" \
                f"starts={b.starts}, contacts={b.contacts_clicks}"
+        if b.swaps:
+            text += f"\nзамен токена: {b.swaps}, последняя за {b.last_swap_ms or 0} мс"
         await c.message.answer(text, reply_markup=bot_row_kb(b.id, b.is_running))
     await c.answer()
 
 @r.callback_query(F.data == "bots:create")
 async def cb_bot_create(c: CallbackQuery):
-    with SessionLocal() as db:
-        tok = next_free_token(db)
-        if not tok:
+    async with AsyncSessionLocal() as db:
+        claimed = await claim_tokens(db, 1)
+        if not claimed:
             await c.message.answer("Нет свободных токенов.")
             return await c.answer()
-        b = create_bot_instance(db, tok)
+        b = await create_bot_instance(db, claimed[0])
     await c.message.answer(f"Создан бот #{b.id}. Запускаю…")
     await c.answer()
     await start_runner(b.id)
 
+async def run_bulk(
+    bot_ids: list[int],
+    op: Callable[[int], Awaitable[str | None]],
+    concurrency: int = FLEET_OP_CONCURRENCY,
+    timeout: float = FLEET_OP_TIMEOUT,
+) -> list[tuple[int, bool, str]]:
+    # одна зависшая операция не держит остальные: ограничение параллелизма + таймаут на бота
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(bot_id: int) -> tuple[int, bool, str]:
+        async with sem:
+            try:
+                note = await asyncio.wait_for(op(bot_id), timeout)
+                return bot_id, True, note or ""
+            except asyncio.TimeoutError:
+                return bot_id, False, f"таймаут {int(timeout)} с"
+            except Exception as e:
+                return bot_id, False, f"{type(e).__name__}: {e}"
+
+    return list(await asyncio.gather(*(one(b) for b in bot_ids)))
+
+def render_bulk_summary(title: str, results: list[tuple[int, bool, str]], elapsed: float) -> str:
+    ok = sum(1 for _, success, _ in results if success)
+    lines = [f"{title}: {ok}/{len(results)} за {elapsed:.1f} с"]
+    for bot_id, success, note in sorted(results):
+        if not success:
+            lines.append(f"❌ #{bot_id} — {note}")
+        elif note:
+            lines.append(f"✅ #{bot_id} — {note}")
+    return "\n".join(lines)
+
+async def _bulk_with_status(c: CallbackQuery, title: str, bot_ids: list[int], op) -> list[tuple[int, bool, str]]:
+    await c.answer()
+    status = await c.message.answer(f"{title}: {len(bot_ids)} бот(ов)…")
+    started = time.monotonic()
+    results = await run_bulk(bot_ids, op)
+    text = render_bulk_summary(title, results, time.monotonic() - started)
+    try:
+        await status.edit_text(text)
+    except Exception:
+        await c.message.answer(text)
+    return results
+
+async def restore_running_mirrors() -> str:
+    # поднимаем всё, что было 🟢 до перезапуска; get_me разносим во времени,
+    # чтобы не ударить по API пачкой одновременных запросов
+    started = time.monotonic()
+    async with AsyncSessionLocal() as db:
+        bot_ids = [b.id for b in await list_bots(db) if b.is_running]
+    if not bot_ids:
+        return "Восстановление зеркал: запущенных ботов не было."
+
+    pacer = TokenBucket(1 / FLEET_RESTORE_STAGGER, capacity=1)
+
+    async def op(bot_id: int) -> str | None:
+        await pacer.acquire()
+        return await start_runner(bot_id)
+
+    results = await run_bulk(bot_ids, op)
+    elapsed = time.monotonic() - started
+    summary = render_bulk_summary("♻️ Восстановление зеркал", results, elapsed)
+    logging.info("Mirrors restored in %.2fs: %s/%s ok", elapsed, sum(1 for _, ok, _ in results if ok), len(results))
+    await settings.set(RESTORE_REPORT_KEY, f"{datetime.utcnow():%Y-%m-%d %H:%M:%S} UTC — {summary}")
+    return summary
+
 @r.callback_query(F.data == "bots:start_all")
 async def cb_start_all(c: CallbackQuery):
-    with SessionLocal() as db:
-        for b in list_bots(db):
-            await start_runner(b.id)
-    await c.message.answer("Все боты запущены.")
-    await c.answer()
+    async with AsyncSessionLocal() as db:
+        bots = await list_bots(db)
+    await _bulk_with_status(c, "▶️ Запуск", [b.id for b in bots], start_runner)
 
 @r.callback_query(F.data == "bots:stop_all")
 async def cb_stop_all(c: CallbackQuery):
-    for bid, runner in list(RUNNERS.items()):
-        await runner.stop()
-        RUNNERS.pop(bid, None)
-    await c.message.answer("Все боты остановлены.")
-    await c.answer()
+    await _bulk_with_status(c, "⏹ Остановка", list(RUNNERS), stop_runner)
 
 @r.callback_query(F.data == "bots:delete_all")
 async def cb_delete_all(c: CallbackQuery):
     # остановить всё и удалить
-    for bid, runner in list(RUNNERS.items()):
-        await runner.stop()
-        RUNNERS.pop(bid, None)
-    with SessionLocal() as db:
-        bots = list_bots(db)
+    await _bulk_with_status(c, "⏹ Остановка перед удалением", list(RUNNERS), stop_runner)
+    async with AsyncSessionLocal() as db:
+        bots = await list_bots(db)
         for b in bots:
-            delete_bot_completely(db, b.id)
-    await c.message.answer("Все боты удалены.")
-    await c.answer()
+            await delete_bot_completely(db, b.id)
+    await c.message.answer(f"Все боты удалены ({len(bots)}).")
 
 @r.callback_query(F.data.regexp(r"^bot:stop:(\d+)$"))
 async def cb_bot_stop(c: CallbackQuery):
@@ -208,15 +286,18 @@ async def cb_bot_stop(c: CallbackQuery):
     if rnr:
         await rnr.stop()
         RUNNERS.pop(bot_id, None)
-    with SessionLocal() as db:
-        set_bot_running(db, bot_id, False, None)
+    async with AsyncSessionLocal() as db:
+        await set_bot_running(db, bot_id, False, None)
     await c.message.edit_reply_markup(reply_markup=bot_row_kb(bot_id, False))
     await c.answer("Остановлен.")
 
 @r.callback_query(F.data.regexp(r"^bot:start:(\d+)$"))
 async def cb_bot_start(c: CallbackQuery):
     bot_id = int(c.data.split(":")[2])
-    await start_runner(bot_id)
+    try:
+        await asyncio.wait_for(start_runner(bot_id), FLEET_OP_TIMEOUT)
+    except Exception as e:
+        return await c.answer(f"Не запустился: {type(e).__name__}", show_alert=True)
     await c.message.edit_reply_markup(reply_markup=bot_row_kb(bot_id, True))
     await c.answer("Запущен.")
 
@@ -227,34 +308,49 @@ async def cb_bot_delete(c: CallbackQuery):
     if rnr:
         await rnr.stop()
         RUNNERS.pop(bot_id, None)
-    with SessionLocal() as db:
-        delete_bot_completely(db, bot_id)
+    async with AsyncSessionLocal() as db:
+        await delete_bot_completely(db, bot_id)
     await c.message.edit_text(f"Бот #{bot_id} удалён.")
     await c.answer()
 
-async def start_runner(bot_id: int):
-    with SessionLocal() as db:
-        token_value = db.execute(
-            select(Token.token)
-            .join(BotInstance, BotInstance.token_id == Token.id)
-            .where(BotInstance.id == bot_id)
-        ).scalars().first()
-        if not token_value:
-            return
-        token = token_value
-    if bot_id in RUNNERS:
-        return
+async def start_runner(bot_id: int) -> str | None:
+    async with AsyncSessionLocal() as db:
+        token = await get_bot_token(db, bot_id)
+    if not token:
+        raise RuntimeError("нет токена")
+    old = RUNNERS.get(bot_id)
+    if old is not None:
+        if old.alive:
+            return "уже запущен"
+        # опрос упал или замена токена не удалась — раннер мёртв, запускаем заново
+        RUNNERS.pop(bot_id, None)
+        await old.detach()
     rnr = MirrorRunner(bot_id, token)
     RUNNERS[bot_id] = rnr
-    await rnr.start()
+    try:
+        await rnr.start()
+    except BaseException as e:
+        # таймаут/ошибка старта — не оставляем полуживой раннер, но и не выключаем зеркало
+        RUNNERS.pop(bot_id, None)
+        try:
+            await asyncio.shield(rnr.abandon(f"Старт не удался: {type(e).__name__}: {e}"))
+        except Exception:
+            pass
+        raise
+    return None
+
+async def stop_runner(bot_id: int) -> str | None:
+    rnr = RUNNERS.pop(bot_id, None)
+    if rnr:
+        await rnr.stop()
+    return None
 
 
 @r.callback_query(F.data == "adm:template")
 async def cb_template(c: CallbackQuery):
 
-    with SessionLocal() as db:
-        text = get_setting(db, "start_template_text") or ""
-        photo = get_setting(db, "start_template_photo") or ""
+    text = settings.get("start_template_text") or ""
+    photo = settings.get("start_template_photo") or ""
     if photo:
         try:
             await c.message.answer_photo(FSInputFile(photo), caption=text or " ")
@@ -303,9 +399,18 @@ async def wait_template_update(msg: Message):
 
         text = getattr(reply, "html_text", None) or (reply.text or "")
 
-    with SessionLocal() as db:
-        set_setting(db, "start_template_text", text)
-        set_setting(db, "start_template_photo", photo_path)
+    old_photo = settings.get("start_template_photo")
+    owner = settings.get(OWNER_ID_SETTING)
+    await settings.set("start_template_text", text)
+    await settings.set("start_template_photo", photo_path)
+
+    if old_photo and old_photo != photo_path:
+        await invalidate_photo(old_photo)
+    if photo_path:
+        # заранее загружаем фото во все зеркала, чтобы /start слал только file_id
+        tokens = [rn.token for rn in RUNNERS.values()]
+        owner_id = int(owner) if owner and owner.isdigit() else None
+        asyncio.create_task(warm_fleet(photo_path, tokens, owner_id))
 
     await msg.answer("Шаблон и фото сохранены." if photo_path else "Шаблон сохранён.")
 
@@ -320,8 +425,7 @@ REPLACE_NOTIFY_DEFAULT = "Новые контакты:\n*Ссылка*"
 @r.callback_query(F.data == "adm:swap_template")
 async def cb_swap_template(c: CallbackQuery):
 
-    with SessionLocal() as db:
-        tmpl = get_setting(db, REPLACE_NOTIFY_TEMPLATE_KEY) or REPLACE_NOTIFY_DEFAULT
+    tmpl = settings.get(REPLACE_NOTIFY_TEMPLATE_KEY) or REPLACE_NOTIFY_DEFAULT
 
     instr = (
         "Это шаблон оповещения, которое рассылается <b>всем активным зеркалам</b> "
@@ -354,8 +458,7 @@ async def wait_swap_template_update(msg: Message):
     reply = await wait_for_next_message(msg.chat.id)
 
     new_text = getattr(reply, "html_text", None) or (reply.text or "")
-    with SessionLocal() as db:
-        set_setting(db, REPLACE_NOTIFY_TEMPLATE_KEY, new_text)
+    await settings.set(REPLACE_NOTIFY_TEMPLATE_KEY, new_text)
     await msg.answer("Шаблон оповещения сохранён.")
 
 
@@ -366,8 +469,7 @@ async def admin_button_open(m: Message):
         return
     if m.from_user.id in SUPERADMINS:
         return await admin_menu(m)
-    with SessionLocal() as db:
-        owner = get_setting(db, OWNER_ID_SETTING)
+    owner = settings.get(OWNER_ID_SETTING)
     if owner and str(m.from_user.id) == owner:
         return await admin_menu(m)
     await m.answer("Доступ запрещён.", reply_markup=ReplyKeyboardRemove())
@@ -408,60 +510,32 @@ async def wait_broadcast(msg: Message):
         text = getattr(reply, "html_text", None) or (reply.text or "")
 
 
-    import asyncio
-    from aiogram import Bot as AioBot
-    from aiogram.types import FSInputFile
-    from mirrorhub.core.db import SessionLocal
-    from mirrorhub.core.repo import list_bots, get_bot_users, add_broadcast_log
-    from mirrorhub.core.models import Token
-
-    total = ok = fail = 0
-
+    # рассылка — задача в БД: переживает рестарт, её можно поставить на паузу или отменить
+    await bookkeeping.flush()
+    status = await msg.answer("📣 Рассылка запускается…")
+    job_id = await broadcast_jobs.submit(text, photo_path, status.chat.id, status.message_id)
+    await status.edit_text(f"📣 Рассылка #{job_id} запущена…", reply_markup=job_kb(job_id, "queued"))
 
-    with SessionLocal() as db:
-        bots = list_bots(db)
-
-    for b in bots:
-
-        with SessionLocal() as db:
-            tok_obj = db.get(Token, b.token_id) if b.token_id else None
-            users = get_bot_users(db, b.id)
-
-        if not tok_obj or not users:
-            continue
-
-        cli = AioBot(token=tok_obj.token)
-        try:
-
-            for u in users:
-                total += 1
-                try:
-                    if photo_path:
-                        await cli.send_photo(
-                            chat_id=u.user_id,
-                            photo=FSInputFile(photo_path),
-                            caption=text,
-                            parse_mode="HTML",
-                        )
-                    else:
-                        await cli.send_message(
-                            chat_id=u.user_id,
-                            text=text,
-                            parse_mode="HTML",
-                        )
-                    ok += 1
-                except Exception:
-                    fail += 1
-
-                    await asyncio.sleep(0.02)
-        finally:
-            await cli.session.close()
-
-
-    with SessionLocal() as db:
-        add_broadcast_log(db, text, photo_path, total, ok, fail)
-
-    await msg.answer(f"Готово. Отправлено: {ok}/{total}. Ошибок: {fail}.")
+@r.callback_query(F.data.regexp(r"^bj:(pause|resume|cancel):\d+$"), admin_only())
+async def cb_broadcast_job(c: CallbackQuery):
+    _, action, job_id = c.data.split(":")
+    op = {"pause": broadcast_jobs.pause, "resume": broadcast_jobs.resume, "cancel": broadcast_jobs.cancel}[action]
+    if await op(int(job_id)):
+        await c.answer("Готово")
+    else:
+        await c.answer("Рассылка уже завершена или в другом состоянии", show_alert=True)
+
+@r.message(Command("broadcasts"), admin_only())
+async def broadcasts_cmd(m: Message):
+    async with AsyncSessionLocal() as db:
+        jobs = await list_broadcast_jobs(db, JOB_UNFINISHED)
+    if not jobs:
+        return await m.answer("Незавершённых рассылок нет.")
+    for job in jobs:
+        await m.answer(
+            f"📣 #{job.id} • {job.status} • {job.ok + job.fail}/{job.total} (ошибок: {job.fail})",
+            reply_markup=job_kb(job.id, job.status),
+        )
 
 
 
@@ -517,48 +591,83 @@ def get_dp():
     return dp
 
 
+STATS_PERIODS = {
+    "all": (None, "📈 За всё", "за всё время"),
+    "30d": (30, "🗓 30 дней", "за 30 дней"),
+    "7d": (7, "🗓 7 дней", "за 7 дней"),
+    "1d": (1, "📅 За день", "за сегодня"),
+}
+
 def _stats_period_kb(selected: str = "all"):
     kb = InlineKeyboardBuilder()
-    labels = {
-        "all": "📈 За всё",
-        "7d": "🗓 За 7 дней",
-        "1d": "📅 За день",
-    }
-    for key in ("all", "7d", "1d"):
-        title = labels[key] + (" •" if key == selected else "")
+    for key, (_days, label, _title) in STATS_PERIODS.items():
+        title = label + (" •" if key == selected else "")
         kb.button(text=title, callback_data=f"adm:stats:{key}")
-    kb.adjust(3)
+    kb.button(text="📆 Свой период" + (" •" if selected == "custom" else ""), callback_data="adm:stats:custom")
+    kb.adjust(3, 2)
     return kb.as_markup()
 
-def _render_stats_text(period_key: str = "all") -> str:
-    days_map = {"all": None, "7d": 7, "1d": 1}
-    title_map = {"all": "за всё время", "7d": "за 7 дней", "1d": "за 1 день"}
-    days = days_map.get(period_key, None)
-    title = title_map.get(period_key, "за всё время")
-
-    from mirrorhub.core.repo import list_bots, get_total_users_period, get_user_counts_by_bot_period
-    with SessionLocal() as db:
-        bots = list_bots(db)
-        total_users = get_total_users_period(db, days)
-        users_by_bot = get_user_counts_by_bot_period(db, days)
-
-    lines = [f"👥 ПОЛЬЗОВАТЕЛИ ({title}): <b>{total_users}</b>", f"🤖 Ботов: {len(bots)}"]
+async def _render_stats_text(period_key: str = "all", since: date | None = None, until: date | None = None) -> str:
+    # всё читается из дневных сводок; свежие /start сначала сбрасываем из write-behind
+    if period_key in STATS_PERIODS:
+        days, _label, title = STATS_PERIODS[period_key]
+        if days is not None:
+            since = datetime.utcnow().date() - timedelta(days=days - 1)
+    else:
+        title = f"с {since:%d.%m.%Y} по {until:%d.%m.%Y}"
+
+    await bookkeeping.flush()
+    async with AsyncSessionLocal() as db:
+        bots = await list_bots(db)
+        total_users = await get_total_users_range(db, since, until)
+        users_by_bot = await get_user_counts_by_bot_range(db, since, until)
+        starts_by_bot = await get_starts_by_bot_range(db, since, until)
+        unreachable = await count_unreachable_users(db)
+
+    lines = [
+        f"👥 ПОЛЬЗОВАТЕЛИ ({title}): <b>{'≈' if STATS_APPROX else ''}{total_users}</b>",
+        f"▶️ Стартов: {sum(starts_by_bot.values())}",
+        f"🤖 Ботов: {len(bots)}",
+    ]
+    if unreachable:
+        # по парам бот–пользователь, не за период: текущее состояние
+        lines.append(
+            f"🚫 Недоступны сейчас: заблокировали {unreachable.get('blocked', 0)}, "
+            f"удалены {unreachable.get('deactivated', 0)}, не найдены {unreachable.get('not_found', 0)}"
+        )
     if bots:
         lines.append("\nПо ботам:")
         for b in bots:
             state = "🟢" if b.is_running else "🔴"
             users = users_by_bot.get(b.id, 0)
             at = f"@{b.username}" if b.username else "—"  # БЕЗ t.me/ссылок
-            lines.append(f"{state} #{b.id} {at} — ПОЛЬЗОВАТЕЛИ={users}")
+            lines.append(f"{state} #{b.id} {at} — ПОЛЬЗОВАТЕЛИ={users}, старты={starts_by_bot.get(b.id, 0)}")
     return "\n".join(lines)
 
 @r.callback_query(F.data == "adm:stats")
 async def cb_stats_default(c: CallbackQuery):
-    await c.message.answer(_render_stats_text("all"), parse_mode="HTML", reply_markup=_stats_period_kb("all"))
+    await c.message.answer(await _render_stats_text("all"), parse_mode="HTML", reply_markup=_stats_period_kb("all"))
     await c.answer()
 
-@r.callback_query(F.data.regexp(r"^adm:stats:(all|7d|1d)$"))
+@r.callback_query(F.data.regexp(r"^adm:stats:(all|30d|7d|1d)$"))
 async def cb_stats_period(c: CallbackQuery):
     period_key = c.data.split(":")[2]
-    await c.message.answer(_render_stats_text(period_key), parse_mode="HTML", reply_markup=_stats_period_kb(period_key))
-    await c.answer()
\ No newline at end of file
+    await c.message.answer(await _render_stats_text(period_key), parse_mode="HTML", reply_markup=_stats_period_kb(period_key))
+    await c.answer()
+
+@r.callback_query(F.data == "adm:stats:custom")
+async def cb_stats_custom(c: CallbackQuery):
+    await c.message.answer("Пришли период: две даты через пробел, например <code>2024-05-01 2024-05-31</code>.")
+    await c.answer()
+    await wait_stats_range(c.message)
+
+async def wait_stats_range(msg: Message):
+    reply = await wait_for_next_message(msg.chat.id)
+    parts = re.findall(r"\d{4}-\d{2}-\d{2}", reply.text or "")
+    try:
+        since, until = sorted(datetime.strptime(p, "%Y-%m-%d").date() for p in parts[:2])
+    except ValueError:
+        return await msg.answer("Не понял даты. Формат: ГГГГ-ММ-ДД ГГГГ-ММ-ДД.")
+    await msg.answer(
+        await _render_stats_text("custom", since, until), parse_mode="HTML", reply_markup=_stats_period_kb("custom")
+    )
@@ -28,3 +28,86 @@ START_TEMPLATE_DEFAULT_PHOTO = None  # путь к файлу или None
 TELETHON_SESSION_NAME = "admin_session"
 
 
+# Рассылка: лимиты Bot API на один токен
+BROADCAST_RATE_PER_TOKEN = 30       # сообщений в секунду на токен
+BROADCAST_WORKERS_PER_TOKEN = 10    # одновременных запросов на токен
+BROADCAST_PROGRESS_EVERY = 3.0      # как часто обновлять статус, сек
+BROADCAST_PAGE_SIZE = 1000          # пользователей за один запрос к БД
+BROADCAST_LANE_QUEUE = 2000         # очередь одного токена; сверх неё — запас токена (overflow)
+BROADCAST_OVERFLOW_MAX = 50_000     # запас всех токенов вместе; дальше чтение из БД ждёт
+BROADCAST_INFLIGHT_PAGES = 10       # страниц впереди сохранённого курсора; после падения уйдут повторно
+
+# Недоступные получатели (заблокировали зеркало / удалили аккаунт) в рассылки не попадают
+USER_READMIT_AFTER_DAYS = 30        # через сколько дней заблокировавших пробуем снова
+USER_READMIT_INTERVAL = 6 * 3600    # как часто проверять, сек
+
+# /change_contact: фоновое редактирование уже отправленных /start
+CONTACT_EDIT_RATE_PER_TOKEN = 25    # правок в секунду на токен
+CONTACT_EDIT_WORKERS = 8            # одновременных запросов на токен
+CONTACT_EDIT_CHECKPOINT_EVERY = 200 # сохранять прогресс в БД каждые N правок
+
+# Кэш настроек: как часто сверять версию настроек с БД (другие процессы), сек
+SETTINGS_CACHE_TTL = 2.0
+
+# Write-behind для учёта /start: сброс в БД раз в N мс или при M событиях
+WRITE_BEHIND_FLUSH_MS = 500
+WRITE_BEHIND_MAX_EVENTS = 500
+
+# SQLite: ожидание блокировки писателя и размер пула соединений
+DB_BUSY_TIMEOUT_MS = 5000
+DB_POOL_SIZE = 5
+DB_POOL_MAX_OVERFLOW = 10
+
+# Long polling зеркал (общий диспетчер)
+MIRROR_POLL_TIMEOUT = 25        # сек, timeout для getUpdates
+MIRROR_POLL_BACKOFF_MAX = 30.0  # максимальная пауза после сетевой ошибки, сек
+
+# Webhook-режим зеркал: один локальный aiohttp-сервер, путь /wh/<bot_id>/<secret>.
+# BASE_URL — публичный https-адрес, который проксируется на HOST:PORT.
+MIRROR_WEBHOOK_ENABLED = False
+MIRROR_WEBHOOK_BASE_URL = ""
+MIRROR_WEBHOOK_HOST = "127.0.0.1"
+MIRROR_WEBHOOK_PORT = 8081
+MIRROR_WEBHOOK_SECRET = ""  # пусто — случайный ключ на каждый запуск
+
+# Общий HTTP-пул для всех Bot(): лимиты соединений и keep-alive
+HTTP_POOL_LIMIT = 100
+HTTP_POOL_LIMIT_PER_HOST = 100
+HTTP_KEEPALIVE_TIMEOUT = 60.0
+
+# Лимиты Bot API на транспорте (send_limiter): общие для всех отправок одного токена
+SEND_RATE_PER_TOKEN = 30            # запросов в чаты в секунду на токен
+SEND_PRIVATE_CHAT_INTERVAL = 1.0    # не чаще раза в секунду в личный чат
+SEND_GROUP_CHAT_INTERVAL = 3.0      # в группы — 20 в минуту
+SEND_MAX_RETRIES = 3                # повторов после RetryAfter, потом ошибка уходит вызывающему
+SEND_RETRY_JITTER = 1.0             # случайная добавка к retry_after, сек
+# доли слотов токена при очереди: ответы /start, админ, уведомления о замене, рассылки/правки
+SEND_PRIORITY_WEIGHTS = (8, 4, 2, 1)
+SEND_BULK_ACTIVE_WINDOW = 5.0       # столько сек после отправки рассылки считаем, что она идёт
+
+# Массовые операции над зеркалами (запустить/остановить/удалить все)
+FLEET_OP_CONCURRENCY = 8    # одновременно обрабатываемых ботов
+FLEET_OP_TIMEOUT = 20.0     # таймаут на одного бота, сек
+FLEET_RESTORE_STAGGER = 0.2 # пауза между get_me при автозапуске зеркал, сек
+
+# Фоновая проверка свободных токенов (getMe)
+TOKEN_CHECK_INTERVAL = 300      # как часто запускать проверку, сек
+TOKEN_CHECK_BATCH = 200         # токенов за один проход
+TOKEN_CHECK_CONCURRENCY = 5     # одновременных getMe
+TOKEN_RECHECK_AFTER = 3600      # перепроверять verified не чаще, сек
+TOKEN_VERIFIED_FRESH = 1800     # verified моложе этого выдаётся без повторного getMe, сек
+TOKEN_CLAIM_LEASE = 120         # аренда токена на время проверки перед выдачей, сек
+
+# Горячая замена забаненного токена
+MIRROR_HEARTBEAT_INTERVAL = 60.0    # проверка getMe в webhook-режиме, сек
+MIRROR_SWAP_READY_TIMEOUT = 60.0    # сколько ждать готовности нового бота для замера, сек
+BAN_WAVE_COLLECT_WINDOW = 1.0       # баны в пределах окна заменяются одной пачкой, сек
+BAN_WAVE_NOTIFY_WINDOW = 30.0       # сводное уведомление о волне банов уходит через, сек
+
+# sent_messages: хранить только последнее /start-сообщение на (бот, чат).
+# Статистика считается по start_events, так что история для неё не нужна.
+SENT_MESSAGES_KEEP_LATEST = False
+
+# Статистика: приблизительный подсчёт уникальных через HyperLogLog (ошибка ≈1.6% при p=12)
+STATS_APPROX = False
+HLL_PRECISION = 12
@@ -0,0 +1,80 @@
+from functools import wraps
+from typing import Any, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mirrorhub.core import repo
+
+# Асинхронные версии функций core/repo.py.
+# Запрос выполняется на соединении aiosqlite через AsyncSession.run_sync,
+# поэтому логика запросов одна, а event loop не блокируется.
+
+
+def _async(fn: Callable[..., Any]):
+    @wraps(fn)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        return await db.run_sync(fn, *args, **kwargs)
+    return wrapper
+
+
+get_setting = _async(repo.get_setting)
+set_setting = _async(repo.set_setting)
+get_settings_version = _async(repo.get_settings_version)
+load_all_settings = _async(repo.load_all_settings)
+
+add_token = _async(repo.add_token)
+add_tokens_bulk = _async(repo.add_tokens_bulk)
+list_tokens = _async(repo.list_tokens)
+next_free_token = _async(repo.next_free_token)
+claim_tokens = _async(repo.claim_tokens)
+release_tokens = _async(repo.release_tokens)
+mark_token_status = _async(repo.mark_token_status)
+list_tokens_to_check = _async(repo.list_tokens_to_check)
+set_token_health = _async(repo.set_token_health)
+delete_tokens_by_ids = _async(repo.delete_tokens_by_ids)
+
+create_bot_instance = _async(repo.create_bot_instance)
+list_bots = _async(repo.list_bots)
+get_bot = _async(repo.get_bot)
+get_bot_token = _async(repo.get_bot_token)
+delete_bot_completely = _async(repo.delete_bot_completely)
+set_bot_meta = _async(repo.set_bot_meta)
+assign_bot_token = _async(repo.assign_bot_token)
+record_token_swap = _async(repo.record_token_swap)
+set_bot_running = _async(repo.set_bot_running)
+set_bot_error = _async(repo.set_bot_error)
+inc_stat_start = _async(repo.inc_stat_start)
+inc_stat_contacts = _async(repo.inc_stat_contacts)
+
+upsert_user = _async(repo.upsert_user)
+apply_start_batch = _async(repo.apply_start_batch)
+get_bot_users = _async(repo.get_bot_users)
+count_audience = _async(repo.count_audience)
+get_audience_page = _async(repo.get_audience_page)
+readmit_users = _async(repo.readmit_users)
+count_unreachable_users = _async(repo.count_unreachable_users)
+
+add_sent_message = _async(repo.add_sent_message)
+iter_sent_msgs = _async(repo.iter_sent_msgs)
+list_bot_sent_msgs = _async(repo.list_bot_sent_msgs)
+mark_sent_msgs = _async(repo.mark_sent_msgs)
+
+get_media_file_id = _async(repo.get_media_file_id)
+save_media_file_id = _async(repo.save_media_file_id)
+delete_media_file_id = _async(repo.delete_media_file_id)
+delete_media_by_hash = _async(repo.delete_media_by_hash)
+
+create_broadcast_job = _async(repo.create_broadcast_job)
+get_broadcast_job = _async(repo.get_broadcast_job)
+list_broadcast_jobs = _async(repo.list_broadcast_jobs)
+update_broadcast_job = _async(repo.update_broadcast_job)
+add_broadcast_log = _async(repo.add_broadcast_log)
+
+aggregate_stats = _async(repo.aggregate_stats)
+get_total_users = _async(repo.get_total_users)
+get_user_counts_by_bot = _async(repo.get_user_counts_by_bot)
+get_total_users_period = _async(repo.get_total_users_period)
+get_user_counts_by_bot_period = _async(repo.get_user_counts_by_bot_period)
+get_total_users_range = _async(repo.get_total_users_range)
+get_user_counts_by_bot_range = _async(repo.get_user_counts_by_bot_range)
+get_starts_by_bot_range = _async(repo.get_starts_by_bot_range)
@@ -0,0 +1,135 @@
+import logging
+from typing import Callable
+
+from mirrorhub.config import HLL_PRECISION
+from mirrorhub.utils.hll import HyperLogLog
+
+log = logging.getLogger(__name__)
+
+
+def _table_columns(conn, table: str) -> set[str]:
+    try:
+        rows = conn.exec_driver_sql(f"PRAGMA table_info({table})").fetchall()
+        return {row[1] for row in rows}  # row[1] = имя колонки
+    except Exception:
+        return set()
+
+def _ensure_columns(conn, table: str, columns: dict[str, str]):
+    existing = _table_columns(conn, table)
+    for name, ddl in columns.items():
+        if name not in existing:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+
+
+# Миграции идут по порядку, номер применённой хранится в PRAGMA user_version.
+# Шаги идемпотентны: свежая БД уже создана create_all по текущим моделям.
+
+def _m1_legacy_columns(conn):
+    # всё, что раньше добавлялось проверкой PRAGMA table_info при каждом старте
+    if "created_at" not in _table_columns(conn, "sent_messages"):
+        conn.exec_driver_sql("ALTER TABLE sent_messages ADD COLUMN created_at TEXT")
+        conn.exec_driver_sql(
+            "UPDATE sent_messages SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL"
+        )
+    _ensure_columns(conn, "tokens", {
+        "checked_at": "DATETIME",
+        "username": "VARCHAR(64)",
+        "link": "VARCHAR(128)",
+        "check_error": "TEXT",
+        "claimed_at": "DATETIME",
+    })
+    _ensure_columns(conn, "sent_messages", {
+        "media": "VARCHAR(8)",
+        "template_hash": "VARCHAR(16)",
+        "editable": "BOOLEAN NOT NULL DEFAULT 1",
+    })
+    _ensure_columns(conn, "bots", {
+        "swaps": "INTEGER DEFAULT 0",
+        "last_swap_at": "DATETIME",
+        "last_swap_ms": "INTEGER",
+    })
+
+def _m2_start_events(conn):
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_sent_bot_kind_chat ON sent_messages (bot_id, kind, chat_id)"
+    )
+    # история /start переезжает в start_events, чтобы sent_messages можно было чистить
+    conn.exec_driver_sql(
+        "INSERT INTO start_events (bot_id, user_id, created_at) "
+        "SELECT bot_id, chat_id, created_at FROM sent_messages "
+        "WHERE kind = 'start_template' AND NOT EXISTS (SELECT 1 FROM start_events)"
+    )
+
+
+def _m3_daily_rollups(conn):
+    # дневные сводки из уже накопленных start_events
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO stat_daily_users (day, bot_id, user_id) "
+        "SELECT DISTINCT date(created_at), bot_id, user_id FROM start_events"
+    )
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO stat_daily (day, bot_id, starts) "
+        "SELECT date(created_at), bot_id, COUNT(*) "
+        "FROM start_events GROUP BY date(created_at), bot_id"
+    )
+
+
+def _m4_hll_sketches(conn):
+    # скетчи по уже накопленным дневным сводкам; day '1970-01-01' — «за всё время», bot_id 0 — все боты
+    sketches: dict[tuple[str, int], HyperLogLog] = {}
+    rows = conn.exec_driver_sql("SELECT day, bot_id, user_id FROM stat_daily_users")
+    for day, bot_id, user_id in rows:
+        for key in ((day, bot_id), (day, 0), ("1970-01-01", bot_id), ("1970-01-01", 0)):
+            sk = sketches.get(key)
+            if sk is None:
+                sk = sketches[key] = HyperLogLog(HLL_PRECISION)
+            sk.add(user_id)
+    if sketches:
+        conn.exec_driver_sql(
+            "INSERT OR REPLACE INTO hll_sketches (day, bot_id, registers) VALUES (?, ?, ?)",
+            [(d, b, sk.to_bytes()) for (d, b), sk in sketches.items()],
+        )
+
+
+def _m5_audience_index(conn):
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_bot_users_user_seen ON bot_users (user_id, last_seen)"
+    )
+
+
+def _m6_user_state(conn):
+    # кто заблокировал зеркало или удалил аккаунт — такие не попадают в рассылки
+    _ensure_columns(conn, "bot_users", {
+        "state": "VARCHAR(16) NOT NULL DEFAULT 'ok'",
+        "state_at": "DATETIME",
+    })
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_bot_users_state ON bot_users (state, state_at)"
+    )
+
+
+def _m7_drop_daily_users(conn):
+    # уникальные за период считаются по stat_daily_users и скетчам, дневной счётчик не нужен
+    if "users" in _table_columns(conn, "stat_daily"):
+        conn.exec_driver_sql("ALTER TABLE stat_daily DROP COLUMN users")
+
+
+MIGRATIONS: list[Callable] = [
+    _m1_legacy_columns,
+    _m2_start_events,
+    _m3_daily_rollups,
+    _m4_hll_sketches,
+    _m5_audience_index,
+    _m6_user_state,
+    _m7_drop_daily_users,
+]
+
+
+def migrate(conn):
+    current = conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+    for version, step in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+        log.info("Applying DB migration %s: %s", version, step.__name__)
+        step(conn)
+        conn.exec_driver_sql(f"PRAGMA user_version = {version}")
@@ -1,5 +1,7 @@
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, UniqueConstraint
+from sqlalchemy import (
+    Column, Integer, String, Boolean, Date, DateTime, Text, LargeBinary, ForeignKey, UniqueConstraint, Index,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from mirrorhub.core.db import Base
@@ -18,6 +20,15 @@ class Token(Base):
     created_at = Column(DateTime, server_default=func.now())
     note = Column(String(255), nullable=True)
 
+    # результат фоновой проверки getMe (verified / dead / banned)
+    checked_at = Column(DateTime, nullable=True)
+    username = Column(String(64), nullable=True)
+    link = Column(String(128), nullable=True)
+    check_error = Column(Text, nullable=True)
+
+    # аренда токена на время проверки/выдачи: пока не истекла, другой запрос его не получит
+    claimed_at = Column(DateTime, nullable=True)
+
 class BotInstance(Base):
     __tablename__ = "bots"
     id = Column(Integer, primary_key=True)
@@ -32,6 +43,11 @@ class BotInstance(Base):
     starts = Column(Integer, default=0)
     contacts_clicks = Column(Integer, default=0)
 
+    # горячая замена токена: сколько раз и как быстро (от бана до ответа нового бота)
+    swaps = Column(Integer, default=0)
+    last_swap_at = Column(DateTime, nullable=True)
+    last_swap_ms = Column(Integer, nullable=True)
+
 class BotUser(Base):
     __tablename__ = "bot_users"
     id = Column(Integer, primary_key=True)
@@ -40,8 +56,17 @@ class BotUser(Base):
     username = Column(String(64), nullable=True)
     first_seen = Column(DateTime, server_default=func.now())
     last_seen = Column(DateTime, server_default=func.now())
+    # ok / blocked / deactivated / not_found — по последней ошибке доставки; /start возвращает в ok
+    state = Column(String(16), nullable=False, default="ok", server_default="ok")
+    state_at = Column(DateTime, nullable=True)
 
-    __table_args__ = (UniqueConstraint('bot_id', 'user_id', name='uix_bot_user'),)
+    __table_args__ = (
+        UniqueConstraint('bot_id', 'user_id', name='uix_bot_user'),
+        # планировщик аудитории: страницы по user_id, внутри — самый свежий бот
+        Index("ix_bot_users_user_seen", "user_id", "last_seen"),
+        # повторная проверка недоступных
+        Index("ix_bot_users_state", "state", "state_at"),
+    )
 
 class SentMessage(Base):
     __tablename__ = "sent_messages"
@@ -50,12 +75,66 @@ class SentMessage(Base):
     chat_id = Column(Integer, nullable=False, index=True)
     message_id = Column(Integer, nullable=False)
     kind = Column(String(32), nullable=False, index=True)
+    # photo / text — чем редактировать: caption или text; NULL у старых записей
+    media = Column(String(8), nullable=True)
+    # хэш текста, с которым сообщение отправлено/отредактировано последним
+    template_hash = Column(String(16), nullable=True)
+    # False — Telegram больше не даёт его редактировать (удалено, слишком старое)
+    editable = Column(Boolean, nullable=False, default=True, server_default="1")
     created_at = Column(
         DateTime,
         server_default=func.current_timestamp(),
         nullable=False,
     )
 
+    # правки /change_contact и keep-latest: bot_id + kind, затем chat_id
+    __table_args__ = (Index("ix_sent_bot_kind_chat", "bot_id", "kind", "chat_id"),)
+
+# Лёгкая строка на каждый /start — только для подсчёта статистики
+class StartEvent(Base):
+    __tablename__ = "start_events"
+    id = Column(Integer, primary_key=True)
+    bot_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, server_default=func.current_timestamp(), nullable=False)
+
+    # COUNT(DISTINCT user_id) по периоду и по ботам читается прямо из индексов
+    __table_args__ = (
+        Index("ix_start_events_created_bot_user", "created_at", "bot_id", "user_id"),
+        Index("ix_start_events_bot_user", "bot_id", "user_id"),
+    )
+
+# Дневные сводки для экрана статистики: обновляются при сбросе write-behind
+class StatDaily(Base):
+    __tablename__ = "stat_daily"
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    bot_id = Column(Integer, nullable=False)
+    starts = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (UniqueConstraint('day', 'bot_id', name='uix_stat_daily'),)
+
+# Уникальные пользователи бота за день: одна строка на (день, бот, пользователь)
+class StatDailyUser(Base):
+    __tablename__ = "stat_daily_users"
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    bot_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+
+    __table_args__ = (UniqueConstraint('day', 'bot_id', 'user_id', name='uix_stat_daily_user'),)
+
+# HyperLogLog-скетч уникальных пользователей: на (день, бот); bot_id=0 — все боты,
+# day=HLL_ALL_TIME — за всё время
+class HllSketch(Base):
+    __tablename__ = "hll_sketches"
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    bot_id = Column(Integer, nullable=False)
+    registers = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (UniqueConstraint('day', 'bot_id', name='uix_hll_day_bot'),)
+
 class BroadcastLog(Base):
     __tablename__ = "broadcasts"
     id = Column(Integer, primary_key=True)
@@ -65,3 +144,31 @@ class BroadcastLog(Base):
     total = Column(Integer, default=0)
     ok = Column(Integer, default=0)
     fail = Column(Integer, default=0)
+
+# Рассылка как задача: переживает рестарт, продолжается с последней отметки
+class BroadcastJob(Base):
+    __tablename__ = "broadcast_jobs"
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    text = Column(Text, nullable=True)
+    photo_path = Column(String(512), nullable=True)
+    # queued / running / paused / cancelled / done
+    status = Column(String(16), nullable=False, default="queued", index=True)
+    # все пользователи с user_id <= cursor уже обработаны
+    cursor_user_id = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, default=0)
+    ok = Column(Integer, default=0)
+    fail = Column(Integer, default=0)
+    status_chat_id = Column(Integer, nullable=True)
+    status_message_id = Column(Integer, nullable=True)
+
+class MediaFile(Base):
+    __tablename__ = "media_files"
+    id = Column(Integer, primary_key=True)
+    token = Column(String(128), nullable=False)
+    file_hash = Column(String(64), nullable=False, index=True)
+    file_id = Column(String(256), nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (UniqueConstraint('token', 'file_hash', name='uix_media_token_hash'),)
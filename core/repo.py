@@ -1,31 +1,34 @@
 from typing import Optional, Iterable, Sequence
 from sqlalchemy import select, update, delete, func
 from sqlalchemy.orm import Session
-from mirrorhub.core.models import Base, Setting, Token, BotInstance, BotUser, SentMessage, BroadcastLog
+from mirrorhub.core.models import (
+    Base, Setting, Token, BotInstance, BotUser, SentMessage, StartEvent, StatDaily, StatDailyUser,
+    HllSketch, BroadcastLog, BroadcastJob, MediaFile,
+)
 from mirrorhub.core.db import engine
+from mirrorhub.core.migrations import migrate
 from mirrorhub.core.models import BotUser
-from datetime import datetime, timedelta
-from sqlalchemy import select, update, delete, func, text as sql_text
+from collections import Counter
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, update, delete, insert, func, case, or_, bindparam, tuple_, text as sql_text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from mirrorhub.config import TOKEN_CLAIM_LEASE, SENT_MESSAGES_KEEP_LATEST, STATS_APPROX, HLL_PRECISION
+from mirrorhub.utils.hll import HyperLogLog
 
 
 def init_db():
     Base.metadata.create_all(bind=engine)
-
-
     with engine.begin() as conn:
-        try:
-            rows = conn.exec_driver_sql("PRAGMA table_info(sent_messages)").fetchall()
-            colnames = {row[1] for row in rows}  # row[1] = имя колонки
-        except Exception:
-            colnames = set()
-
-        if "created_at" not in colnames:
-
-            conn.exec_driver_sql("ALTER TABLE sent_messages ADD COLUMN created_at TEXT")
-
-            conn.exec_driver_sql(
-                "UPDATE sent_messages SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL"
-            )
+        migrate(conn)
+        if SENT_MESSAGES_KEEP_LATEST:
+            prune_sent_messages(conn)
+
+def prune_sent_messages(conn):
+    # оставляем последнее сообщение каждого вида на (бот, чат); статистика живёт в start_events
+    conn.exec_driver_sql(
+        "DELETE FROM sent_messages WHERE id NOT IN "
+        "(SELECT MAX(id) FROM sent_messages GROUP BY bot_id, chat_id, kind)"
+    )
 
 
 
@@ -33,6 +36,8 @@ def get_setting(db: Session, key: str) -> Optional[str]:
     row = db.execute(select(Setting).where(Setting.key == key)).scalar_one_or_none()
     return row.value if row else None
 
+SETTINGS_VERSION_KEY = "settings_version"
+
 def set_setting(db: Session, key: str, value: Optional[str]):
     row = db.execute(select(Setting).where(Setting.key == key)).scalar_one_or_none()
     if not row:
@@ -40,8 +45,27 @@ def set_setting(db: Session, key: str, value: Optional[str]):
         db.add(row)
     else:
         row.value = value
+    _bump_settings_version(db)
     db.commit()
 
+def _bump_settings_version(db: Session):
+    # счётчик изменений: по нему кэши в других процессах понимают, что пора перечитать
+    res = db.execute(
+        update(Setting)
+        .where(Setting.key == SETTINGS_VERSION_KEY)
+        .values(value=sql_text("CAST(COALESCE(value, '0') AS INTEGER) + 1"))
+    )
+    if not res.rowcount:
+        db.add(Setting(key=SETTINGS_VERSION_KEY, value="1"))
+
+def get_settings_version(db: Session) -> int:
+    v = get_setting(db, SETTINGS_VERSION_KEY)
+    return int(v) if v and v.isdigit() else 0
+
+def load_all_settings(db: Session) -> dict[str, Optional[str]]:
+    rows = db.execute(select(Setting.key, Setting.value)).all()
+    return {k: v for k, v in rows}
+
 
 def add_token(db: Session, token: str, note: Optional[str] = None):
     t = Token(token=token.strip(), status="free", note=note)
@@ -66,11 +90,84 @@ def add_tokens_bulk(db: Session, tokens: Sequence[str]) -> tuple[int, list[str]]
 def list_tokens(db: Session):
     return db.execute(select(Token).order_by(Token.id)).scalars().all()
 
+TOKEN_AVAILABLE_STATUSES = ("verified", "free")
+
+def _token_unclaimed(lease_seconds: int = TOKEN_CLAIM_LEASE):
+    # брошенная аренда (процесс упал между claim и выдачей) истекает сама
+    return or_(Token.claimed_at.is_(None), Token.claimed_at < datetime.utcnow() - timedelta(seconds=lease_seconds))
+
 def next_free_token(db: Session) -> Optional[Token]:
+    # сначала проверенные фоновым чекером, затем ещё не проверенные
     return db.execute(
-        select(Token).where(Token.status == "free").order_by(Token.id).limit(1)
+        select(Token)
+        .where(Token.status.in_(TOKEN_AVAILABLE_STATUSES), _token_unclaimed())
+        .order_by(case((Token.status == "verified", 0), else_=1), Token.id)
+        .limit(1)
     ).scalars().first()
 
+def claim_tokens(db: Session, count: int = 1) -> list[Token]:
+    # выбор и аренда одним UPDATE ... RETURNING: параллельные замены/создания
+    # не могут получить один и тот же токен
+    if count <= 0:
+        return []
+    pick = (
+        select(Token.id)
+        .where(Token.status.in_(TOKEN_AVAILABLE_STATUSES), _token_unclaimed())
+        .order_by(case((Token.status == "verified", 0), else_=1), Token.id)
+        .limit(count)
+    )
+    rows = db.execute(
+        update(Token)
+        .where(Token.id.in_(pick), Token.status.in_(TOKEN_AVAILABLE_STATUSES), _token_unclaimed())
+        .values(claimed_at=datetime.utcnow())
+        .returning(Token)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    return list(rows)
+
+def release_tokens(db: Session, token_ids: Sequence[int]):
+    if not token_ids:
+        return
+    db.execute(update(Token).where(Token.id.in_(list(token_ids))).values(claimed_at=None))
+    db.commit()
+
+def list_tokens_to_check(db: Session, checked_before: datetime, limit: int) -> list[tuple[int, str]]:
+    rows = db.execute(
+        select(Token.id, Token.token)
+        .where(
+            Token.status.in_(TOKEN_AVAILABLE_STATUSES),
+            Token.claimed_at.is_(None),
+            or_(Token.checked_at.is_(None), Token.checked_at < checked_before),
+        )
+        .order_by(Token.checked_at.is_not(None), Token.checked_at, Token.id)
+        .limit(limit)
+    ).all()
+    return [(int(i), t) for i, t in rows]
+
+def set_token_health(
+    db: Session,
+    token_id: int,
+    status: str,
+    username: Optional[str] = None,
+    link: Optional[str] = None,
+    error: Optional[str] = None,
+    leased: bool = False,
+) -> bool:
+    # только для свободных токенов: выданный в работу токен чекер не трогает.
+    # Фоновый чекер пишет лишь в неарендованные и аренду не снимает — иначе проверка,
+    # закончившаяся между claim_tokens и выдачей, отдаст тот же токен второй раз.
+    # leased=True — пишет владелец аренды (allocate_tokens), он же её и снимает.
+    conds = [Token.id == token_id, Token.status.in_(TOKEN_AVAILABLE_STATUSES)]
+    values = dict(status=status, username=username, link=link, check_error=error, checked_at=datetime.utcnow())
+    if leased:
+        values["claimed_at"] = None
+    else:
+        conds.append(_token_unclaimed())
+    res = db.execute(update(Token).where(*conds).values(**values))
+    db.commit()
+    return bool(res.rowcount)
+
 def mark_token_status(db: Session, token_id: int, status: str):
     db.execute(update(Token).where(Token.id == token_id).values(status=status))
     db.commit()
@@ -80,7 +177,7 @@ def delete_tokens_by_ids(db: Session, ids: Sequence[int]) -> tuple[int, list[int
     if not ids:
         return 0, []
     in_use_rows = db.execute(
-        select(Token.id).where(Token.id.in_(ids), Token.status == "in_use")
+        select(Token.id).where(Token.id.in_(ids), or_(Token.status == "in_use", ~_token_unclaimed()))
     ).scalars().all()
     to_delete = [i for i in ids if i not in in_use_rows]
     if to_delete:
@@ -90,7 +187,7 @@ def delete_tokens_by_ids(db: Session, ids: Sequence[int]) -> tuple[int, list[int
 
 
 def create_bot_instance(db: Session, token: Token) -> BotInstance:
-    mark_token_status(db, token.id, "in_use")
+    db.execute(update(Token).where(Token.id == token.id).values(status="in_use", claimed_at=None))
     b = BotInstance(token_id=token.id)
     db.add(b); db.commit(); db.refresh(b)
     return b
@@ -101,6 +198,13 @@ def list_bots(db: Session):
 def get_bot(db: Session, bot_id: int) -> Optional[BotInstance]:
     return db.get(BotInstance, bot_id)
 
+def get_bot_token(db: Session, bot_id: int) -> Optional[str]:
+    return db.execute(
+        select(Token.token)
+        .join(BotInstance, BotInstance.token_id == Token.id)
+        .where(BotInstance.id == bot_id)
+    ).scalars().first()
+
 def delete_bot_completely(db: Session, bot_id: int):
     b = db.get(BotInstance, bot_id)
     if not b:
@@ -110,6 +214,31 @@ def delete_bot_completely(db: Session, bot_id: int):
     db.execute(delete(BotInstance).where(BotInstance.id == bot_id))
     db.commit()
 
+def assign_bot_token(db: Session, bot_id: int, token_id: int, username: str, link: str) -> bool:
+    bot = db.get(BotInstance, bot_id)
+    if not bot:
+        return False
+    bot.token_id = token_id
+    bot.username = username
+    bot.link = link
+    bot.is_running = True
+    bot.last_error = None
+    db.execute(update(Token).where(Token.id == token_id).values(status="in_use", claimed_at=None))
+    db.commit()
+    return True
+
+def record_token_swap(db: Session, bot_id: int, latency_ms: int):
+    db.execute(
+        update(BotInstance)
+        .where(BotInstance.id == bot_id)
+        .values(
+            swaps=func.coalesce(BotInstance.swaps, 0) + 1,
+            last_swap_at=datetime.utcnow(),
+            last_swap_ms=latency_ms,
+        )
+    )
+    db.commit()
+
 def set_bot_meta(db: Session, bot_id: int, username: str, link: str):
     db.execute(update(BotInstance).where(BotInstance.id == bot_id).values(username=username, link=link))
     db.commit()
@@ -118,6 +247,11 @@ def set_bot_running(db: Session, bot_id: int, is_running: bool, last_error: Opti
     db.execute(update(BotInstance).where(BotInstance.id == bot_id).values(is_running=is_running, last_error=last_error))
     db.commit()
 
+def set_bot_error(db: Session, bot_id: int, last_error: Optional[str]):
+    # только причина сбоя: is_running не меняется, зеркало поднимется при восстановлении
+    db.execute(update(BotInstance).where(BotInstance.id == bot_id).values(last_error=last_error))
+    db.commit()
+
 def inc_stat_start(db: Session, bot_id: int):
     db.execute(update(BotInstance).where(BotInstance.id == bot_id).values(starts=BotInstance.starts + 1))
     db.commit()
@@ -136,9 +270,214 @@ def upsert_user(db: Session, bot_id: int, user_id: int, username: Optional[str])
         db.add(row)
     db.commit()
 
+def apply_start_batch(
+    db: Session,
+    starts: dict[int, int],
+    users: Sequence[dict],
+    messages: Sequence[dict],
+    events: Sequence[dict] = (),
+    states: Sequence[dict] = (),
+):
+    # всё, что накопил write-behind, пишем одной транзакцией
+    for bot_id, n in starts.items():
+        db.execute(update(BotInstance).where(BotInstance.id == bot_id).values(starts=BotInstance.starts + n))
+    if users:
+        stmt = sqlite_insert(BotUser).values(list(users))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[BotUser.bot_id, BotUser.user_id],
+            set_={
+                "username": stmt.excluded.username,
+                "last_seen": stmt.excluded.last_seen,
+                # /start — человек снова доступен (разблокировал бота)
+                "state": "ok",
+                "state_at": case((BotUser.state != "ok", stmt.excluded.last_seen), else_=BotUser.state_at),
+            },
+        )
+        db.execute(stmt)
+    if states:
+        # после upsert: ошибки доставки в буфере всегда новее последнего /start
+        _apply_user_states(db, states)
+    if messages:
+        if SENT_MESSAGES_KEEP_LATEST:
+            # для правок нужно только последнее сообщение в чате — старые удаляем
+            messages = list({(m["bot_id"], m["chat_id"], m["kind"]): m for m in messages}.values())
+            db.connection().execute(
+                SentMessage.__table__.delete().where(
+                    SentMessage.bot_id == bindparam("b_bot_id"),
+                    SentMessage.chat_id == bindparam("b_chat_id"),
+                    SentMessage.kind == bindparam("b_kind"),
+                ),
+                [{"b_bot_id": m["bot_id"], "b_chat_id": m["chat_id"], "b_kind": m["kind"]} for m in messages],
+            )
+        db.execute(insert(SentMessage), list(messages))
+    if events:
+        db.execute(insert(StartEvent), list(events))
+        _apply_daily_rollups(db, events)
+    db.commit()
+
+def _apply_user_states(db: Session, states: Sequence[dict]):
+    # states: [{"bot_id", "user_id", "state", "state_at"}]
+    # Forbidden от токена, который человек не запускал, — не блокировка: после замены
+    # токена такие пользователи просто ещё не писали новому боту
+    swapped_at = select(BotInstance.last_swap_at).where(BotInstance.id == BotUser.bot_id).scalar_subquery()
+    db.connection().execute(
+        BotUser.__table__.update()
+        .where(
+            BotUser.bot_id == bindparam("b_bot_id"), BotUser.user_id == bindparam("b_user_id"),
+            or_(bindparam("b_state") != "blocked", swapped_at.is_(None), BotUser.last_seen >= swapped_at),
+        )
+        .values(state=bindparam("b_state"), state_at=bindparam("b_state_at")),
+        [
+            {"b_bot_id": r["bot_id"], "b_user_id": r["user_id"], "b_state": r["state"], "b_state_at": r["state_at"]}
+            for r in states
+        ],
+    )
+
+def readmit_users(db: Session, states: Sequence[str], older_than: datetime) -> int:
+    # недоступные дольше срока снова попадают в рассылки; если всё ещё недоступны,
+    # первая же отправка вернёт их обратно
+    res = db.execute(
+        update(BotUser)
+        .where(BotUser.state.in_(list(states)), BotUser.state_at < older_than)
+        .values(state="ok", state_at=datetime.utcnow())
+    )
+    db.commit()
+    return res.rowcount or 0
+
+def count_unreachable_users(db: Session) -> dict[str, int]:
+    rows = db.execute(
+        select(BotUser.state, func.count()).where(BotUser.state != "ok").group_by(BotUser.state)
+    ).all()
+    return {state: int(n) for state, n in rows}
+
+def _apply_daily_rollups(db: Session, events: Sequence[dict]):
+    starts: Counter[tuple[date, int]] = Counter()
+    day_users: set[tuple[date, int, int]] = set()
+    for e in events:
+        key = (e["created_at"].date(), e["bot_id"])
+        starts[key] += 1
+        day_users.add((key[0], key[1], e["user_id"]))
+
+    stmt = sqlite_insert(StatDailyUser).values(
+        [{"day": d, "bot_id": b, "user_id": u} for d, b, u in day_users]
+    )
+    db.execute(stmt.on_conflict_do_nothing(index_elements=[StatDailyUser.day, StatDailyUser.bot_id, StatDailyUser.user_id]))
+
+    stmt = sqlite_insert(StatDaily).values(
+        [{"day": d, "bot_id": b, "starts": n} for (d, b), n in starts.items()]
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[StatDaily.day, StatDaily.bot_id],
+        set_={"starts": StatDaily.starts + stmt.excluded.starts},
+    ))
+    _update_hll_sketches(db, day_users)
+
+HLL_ALL_TIME = date(1970, 1, 1)  # day скетча «за всё время»
+HLL_ALL_BOTS = 0                 # bot_id скетча «все боты»
+
+def _update_hll_sketches(db: Session, day_users: Iterable[tuple[date, int, int]]):
+    groups: dict[tuple[date, int], list[int]] = {}
+    for d, b, u in day_users:
+        for key in ((d, b), (d, HLL_ALL_BOTS), (HLL_ALL_TIME, b), (HLL_ALL_TIME, HLL_ALL_BOTS)):
+            groups.setdefault(key, []).append(u)
+    if not groups:
+        return
+    rows = db.execute(
+        select(HllSketch.day, HllSketch.bot_id, HllSketch.registers)
+        .where(tuple_(HllSketch.day, HllSketch.bot_id).in_(list(groups)))
+    ).all()
+    sketches = {(d, b): HyperLogLog.from_bytes(reg) for d, b, reg in rows}
+    values = []
+    for key, users in groups.items():
+        sk = sketches.get(key) or HyperLogLog(HLL_PRECISION)
+        for u in users:
+            sk.add(u)
+        values.append({"day": key[0], "bot_id": key[1], "registers": sk.to_bytes()})
+    stmt = sqlite_insert(HllSketch).values(values)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[HllSketch.day, HllSketch.bot_id],
+        set_={"registers": stmt.excluded.registers},
+    ))
+
+def _hll_query(q, since: Optional[date], until: Optional[date]):
+    if since is None and until is None:
+        return q.where(HllSketch.day == HLL_ALL_TIME)
+    q = q.where(HllSketch.day != HLL_ALL_TIME)
+    if since is not None:
+        q = q.where(HllSketch.day >= since)
+    if until is not None:
+        q = q.where(HllSketch.day <= until)
+    return q
+
+def _approx_total_users(db: Session, since: Optional[date], until: Optional[date]) -> int:
+    q = _hll_query(select(HllSketch.registers).where(HllSketch.bot_id == HLL_ALL_BOTS), since, until)
+    merged: Optional[HyperLogLog] = None
+    for reg in db.execute(q).scalars():
+        sk = HyperLogLog.from_bytes(reg)
+        merged = sk if merged is None else merged.merge(sk)
+    return merged.count() if merged else 0
+
+def _approx_user_counts_by_bot(db: Session, since: Optional[date], until: Optional[date]) -> dict[int, int]:
+    q = _hll_query(select(HllSketch.bot_id, HllSketch.registers).where(HllSketch.bot_id != HLL_ALL_BOTS), since, until)
+    merged: dict[int, HyperLogLog] = {}
+    for bot_id, reg in db.execute(q).all():
+        sk = HyperLogLog.from_bytes(reg)
+        merged[bot_id] = merged[bot_id].merge(sk) if bot_id in merged else sk
+    return {int(b): sk.count() for b, sk in merged.items()}
+
 def get_bot_users(db: Session, bot_id: int) -> list[BotUser]:
     return db.execute(select(BotUser).where(BotUser.bot_id == bot_id)).scalars().all()
 
+def _started_current_token():
+    # после замены токена зеркало может писать только тем, кто уже запустил новый токен
+    return or_(BotInstance.last_swap_at.is_(None), BotUser.last_seen >= BotInstance.last_swap_at)
+
+def _running_users():
+    return (
+        select(BotUser.user_id)
+        .join(BotInstance, BotInstance.id == BotUser.bot_id)
+        .where(
+            BotInstance.is_running.is_(True), BotInstance.token_id.is_not(None),
+            # заблокировавших бота и удалённые аккаунты пропускаем
+            BotUser.state == "ok",
+            _started_current_token(),
+        )
+    )
+
+def count_audience(db: Session) -> int:
+    q = _running_users().with_only_columns(func.count(func.distinct(BotUser.user_id)))
+    return int(db.execute(q).scalar() or 0)
+
+def get_audience_page(db: Session, after_user_id: int, limit: int) -> list[tuple[int, int, str]]:
+    # -> [(user_id, bot_id, token)] по возрастанию user_id, строго после after_user_id.
+    # Каждый человек один раз — через запущенное зеркало, с которым общался последним
+    # которое он не заблокировал и чей текущий токен он уже запускал.
+    page = _running_users().where(BotUser.user_id > after_user_id).distinct().order_by(BotUser.user_id).limit(limit)
+    ranked = (
+        select(
+            BotUser.user_id,
+            BotUser.bot_id,
+            Token.token,
+            func.row_number().over(
+                partition_by=BotUser.user_id,
+                order_by=(BotUser.last_seen.desc(), BotUser.bot_id.desc()),
+            ).label("rn"),
+        )
+        .join(BotInstance, BotInstance.id == BotUser.bot_id)
+        .join(Token, Token.id == BotInstance.token_id)
+        .where(
+            BotInstance.is_running.is_(True), BotUser.state == "ok", _started_current_token(),
+            BotUser.user_id.in_(page),
+        )
+        .subquery()
+    )
+    rows = db.execute(
+        select(ranked.c.user_id, ranked.c.bot_id, ranked.c.token)
+        .where(ranked.c.rn == 1)
+        .order_by(ranked.c.user_id)
+    ).all()
+    return [(int(u), int(b), t) for u, b, t in rows]
+
 
 def add_sent_message(db: Session, bot_id: int, chat_id: int, message_id: int, kind: str):
     db.add(SentMessage(bot_id=bot_id, chat_id=chat_id, message_id=message_id, kind=kind))
@@ -147,6 +486,73 @@ def add_sent_message(db: Session, bot_id: int, chat_id: int, message_id: int, ki
 def iter_sent_msgs(db: Session, kind: str) -> Iterable[SentMessage]:
     return db.execute(select(SentMessage).where(SentMessage.kind == kind)).scalars().all()
 
+def list_bot_sent_msgs(
+    db: Session, bot_id: int, kind: str, skip_hash: Optional[str] = None,
+) -> list[tuple[int, int, int, Optional[str]]]:
+    # -> [(id, chat_id, message_id, media)] только этого бота, без ORM-объектов;
+    # уже показывающие skip_hash и нередактируемые пропускаются
+    q = select(SentMessage.id, SentMessage.chat_id, SentMessage.message_id, SentMessage.media).where(
+        SentMessage.bot_id == bot_id, SentMessage.kind == kind, SentMessage.editable.is_(True),
+    )
+    if skip_hash:
+        q = q.where(or_(SentMessage.template_hash.is_(None), SentMessage.template_hash != skip_hash))
+    rows = db.execute(q.order_by(SentMessage.id)).all()
+    return [(int(i), int(c), int(mid), media) for i, c, mid, media in rows]
+
+def mark_sent_msgs(db: Session, ids: Sequence[int], template_hash: Optional[str] = None, editable: bool = True):
+    if not ids:
+        return
+    values = {"template_hash": template_hash} if editable else {"editable": False}
+    db.execute(update(SentMessage).where(SentMessage.id.in_(list(ids))).values(**values))
+    db.commit()
+
+
+def get_media_file_id(db: Session, token: str, file_hash: str) -> Optional[str]:
+    return db.execute(
+        select(MediaFile.file_id).where(MediaFile.token == token, MediaFile.file_hash == file_hash)
+    ).scalars().first()
+
+def save_media_file_id(db: Session, token: str, file_hash: str, file_id: str):
+    row = db.execute(
+        select(MediaFile).where(MediaFile.token == token, MediaFile.file_hash == file_hash)
+    ).scalar_one_or_none()
+    if row:
+        row.file_id = file_id
+    else:
+        db.add(MediaFile(token=token, file_hash=file_hash, file_id=file_id))
+    db.commit()
+
+def delete_media_file_id(db: Session, token: str, file_hash: str):
+    db.execute(delete(MediaFile).where(MediaFile.token == token, MediaFile.file_hash == file_hash))
+    db.commit()
+
+def delete_media_by_hash(db: Session, file_hash: str):
+    db.execute(delete(MediaFile).where(MediaFile.file_hash == file_hash))
+    db.commit()
+
+
+def create_broadcast_job(
+    db: Session, text: Optional[str], photo_path: Optional[str], total: int,
+    status_chat_id: Optional[int] = None, status_message_id: Optional[int] = None,
+) -> BroadcastJob:
+    job = BroadcastJob(
+        text=text, photo_path=photo_path, total=total, status="queued",
+        status_chat_id=status_chat_id, status_message_id=status_message_id,
+    )
+    db.add(job); db.commit(); db.refresh(job)
+    return job
+
+def get_broadcast_job(db: Session, job_id: int) -> Optional[BroadcastJob]:
+    return db.get(BroadcastJob, job_id)
+
+def list_broadcast_jobs(db: Session, statuses: Sequence[str]) -> list[BroadcastJob]:
+    return db.execute(
+        select(BroadcastJob).where(BroadcastJob.status.in_(list(statuses))).order_by(BroadcastJob.id)
+    ).scalars().all()
+
+def update_broadcast_job(db: Session, job_id: int, **values):
+    db.execute(update(BroadcastJob).where(BroadcastJob.id == job_id).values(**values))
+    db.commit()
 
 def add_broadcast_log(db: Session, text: Optional[str], photo_path: Optional[str], total: int, ok: int, fail: int):
     db.add(BroadcastLog(text=text, photo_path=photo_path, total=total, ok=ok, fail=fail))
@@ -178,29 +584,47 @@ def get_user_counts_by_bot(db: Session) -> dict[int, int]:
     return {int(bot_id): int(cnt) for bot_id, cnt in rows}
 
 
-def get_total_users_period(db: Session, days: int | None) -> int:
-    q = select(func.count(func.distinct(SentMessage.chat_id))).where(
-        SentMessage.kind == "start_template"
+def _period_since(days: int | None) -> Optional[date]:
+    # 1 день — сегодня (UTC), 7 дней — сегодня и шесть предыдущих
+    return None if days is None else datetime.utcnow().date() - timedelta(days=days - 1)
+
+def _day_range(q, since: Optional[date], until: Optional[date]):
+    if since is not None:
+        q = q.where(StatDailyUser.day >= since)
+    if until is not None:
+        q = q.where(StatDailyUser.day <= until)
+    return q
+
+def get_total_users_range(db: Session, since: Optional[date], until: Optional[date] = None) -> int:
+    if STATS_APPROX:
+        return _approx_total_users(db, since, until)
+    if since is None and until is None:
+        # за всё время bot_users компактнее дневных строк
+        return get_total_users(db)
+    q = _day_range(select(func.count(func.distinct(StatDailyUser.user_id))), since, until)
+    return int(db.execute(q).scalar() or 0)
+
+def get_user_counts_by_bot_range(db: Session, since: Optional[date], until: Optional[date] = None) -> dict[int, int]:
+    if STATS_APPROX:
+        return _approx_user_counts_by_bot(db, since, until)
+    if since is None and until is None:
+        return get_user_counts_by_bot(db)
+    q = _day_range(
+        select(StatDailyUser.bot_id, func.count(func.distinct(StatDailyUser.user_id))).group_by(StatDailyUser.bot_id),
+        since, until,
     )
-    if days is not None:
-        since = datetime.utcnow() - timedelta(days=days)
-        # если колонка есть — фильтруем по дате
-        if hasattr(SentMessage, "created_at"):
-            q = q.where(SentMessage.created_at >= since)
-    val = db.execute(q).scalar()
-    return int(val or 0)
+    return {int(bot_id): int(cnt) for bot_id, cnt in db.execute(q).all()}
+
+def get_starts_by_bot_range(db: Session, since: Optional[date], until: Optional[date] = None) -> dict[int, int]:
+    q = select(StatDaily.bot_id, func.sum(StatDaily.starts)).group_by(StatDaily.bot_id)
+    if since is not None:
+        q = q.where(StatDaily.day >= since)
+    if until is not None:
+        q = q.where(StatDaily.day <= until)
+    return {int(bot_id): int(n or 0) for bot_id, n in db.execute(q).all()}
+
+def get_total_users_period(db: Session, days: int | None) -> int:
+    return get_total_users_range(db, _period_since(days))
 
 def get_user_counts_by_bot_period(db: Session, days: int | None) -> dict[int, int]:
-    q = (
-        select(
-            SentMessage.bot_id,
-            func.count(func.distinct(SentMessage.chat_id))
-        )
-        .where(SentMessage.kind == "start_template")
-        .group_by(SentMessage.bot_id)
-    )
-    if days is not None and hasattr(SentMessage, "created_at"):
-        since = datetime.utcnow() - timedelta(days=days)
-        q = q.where(SentMessage.created_at >= since)
-    rows = db.execute(q).all()
-    return {int(bot_id): int(cnt) for bot_id, cnt in rows}
\ No newline at end of file
+    return get_user_counts_by_bot_range(db, _period_since(days))
\ No newline at end of file
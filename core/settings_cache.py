@@ -0,0 +1,94 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+from mirrorhub.config import SETTINGS_CACHE_TTL
+from mirrorhub.core import arepo
+from mirrorhub.core.db import SessionLocal, AsyncSessionLocal
+from mirrorhub.core.repo import get_settings_version, load_all_settings
+
+
+class SettingsCache:
+    def __init__(self, ttl: float = SETTINGS_CACHE_TTL):
+        self.ttl = ttl
+        self._values: dict[str, Optional[str]] = {}
+        self._version: int | None = None
+        self._checked_at = 0.0
+        self._isfile: dict[str, bool] = {}
+        self._task: asyncio.Task | None = None
+
+    def _refresh(self):
+        # при запущенном watch() синхронно читаем БД только при холодном старте
+        if self._version is not None and self._task is not None and not self._task.done():
+            return
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.ttl:
+            return
+        self._checked_at = now
+        # кэш проверок файлов живёт не дольше одного интервала
+        self._isfile.clear()
+        with SessionLocal() as db:
+            version = get_settings_version(db)
+            if version != self._version:
+                self._values = load_all_settings(db)
+                self._version = version
+
+    async def reload(self, force: bool = False):
+        self._checked_at = time.monotonic()
+        self._isfile.clear()
+        async with AsyncSessionLocal() as db:
+            version = await arepo.get_settings_version(db)
+            if force or version != self._version:
+                self._values = await arepo.load_all_settings(db)
+                self._version = version
+
+    async def _watch(self):
+        while True:
+            try:
+                await self.reload()
+            except Exception:
+                pass
+            await asyncio.sleep(self.ttl)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def get(self, key: str) -> Optional[str]:
+        self._refresh()
+        return self._values.get(key)
+
+    def get_str(self, key: str, default: str = "") -> str:
+        v = self.get(key)
+        return v.strip() if v and v.strip() else default
+
+    def get_int(self, key: str) -> Optional[int]:
+        v = (self.get(key) or "").strip()
+        return int(v) if v.lstrip("-").isdigit() else None
+
+    async def set(self, key: str, value: Optional[str]):
+        async with AsyncSessionLocal() as db:
+            await arepo.set_setting(db, key, value)
+        await self.reload(force=True)
+
+    def isfile(self, path: str | None) -> bool:
+        if not path:
+            return False
+        self._refresh()
+        ok = self._isfile.get(path)
+        if ok is None:
+            ok = self._isfile[path] = os.path.isfile(path)
+        return ok
+
+
+settings = SettingsCache()
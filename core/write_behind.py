@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from mirrorhub.config import WRITE_BEHIND_FLUSH_MS, WRITE_BEHIND_MAX_EVENTS
+from mirrorhub.core.db import AsyncSessionLocal
+from mirrorhub.core.arepo import apply_start_batch
+
+log = logging.getLogger(__name__)
+
+
+class WriteBehind:
+    def __init__(self, flush_ms: int = WRITE_BEHIND_FLUSH_MS, max_events: int = WRITE_BEHIND_MAX_EVENTS):
+        self.flush_interval = flush_ms / 1000
+        self.max_events = max_events
+        self._starts: Counter[int] = Counter()
+        self._users: dict[tuple[int, int], dict] = {}
+        self._messages: list[dict] = []
+        self._events: list[dict] = []
+        self._states: dict[tuple[int, int], dict] = {}
+        self._pending = 0
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+    def _bump(self):
+        self._pending += 1
+        if self._pending >= self.max_events:
+            self._wake.set()
+
+    def record_start(self, bot_id: int, user_id: int, username: Optional[str]):
+        now = datetime.utcnow()
+        self._starts[bot_id] += 1
+        prev = self._users.get((bot_id, user_id))
+        self._users[(bot_id, user_id)] = {
+            "bot_id": bot_id,
+            "user_id": user_id,
+            "username": username,
+            "first_seen": prev["first_seen"] if prev else now,
+            "last_seen": now,
+        }
+        self._events.append({"bot_id": bot_id, "user_id": user_id, "created_at": now})
+        # ошибка доставки до этого /start уже неактуальна
+        self._states.pop((bot_id, user_id), None)
+        self._bump()
+
+    def record_user_state(self, bot_id: int, user_id: int, state: str):
+        self._states[(bot_id, user_id)] = {
+            "bot_id": bot_id,
+            "user_id": user_id,
+            "state": state,
+            "state_at": datetime.utcnow(),
+        }
+        self._bump()
+
+    def record_message(self, bot_id: int, chat_id: int, message_id: int, kind: str,
+                       media: Optional[str] = None, template_hash: Optional[str] = None):
+        self._messages.append({
+            "bot_id": bot_id,
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "kind": kind,
+            "media": media,
+            "template_hash": template_hash,
+            "created_at": datetime.utcnow(),
+        })
+        self._bump()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            starts, users, messages, events = self._starts, self._users, self._messages, self._events
+            states = self._states
+            self._starts, self._users, self._messages, self._events = Counter(), {}, [], []
+            self._states = {}
+            self._pending = 0
+            try:
+                async with AsyncSessionLocal() as db:
+                    await apply_start_batch(
+                        db, dict(starts), list(users.values()), messages, events, list(states.values()),
+                    )
+            except Exception:
+                log.exception("Write-behind flush failed, events kept for retry")
+                self._requeue(starts, users, messages, events, states)
+                raise
+
+    def _requeue(self, starts: Counter, users: dict, messages: list[dict], events: list[dict], states: dict):
+        self._starts.update(starts)
+        for key, row in users.items():
+            # более свежие данные из нового буфера важнее
+            self._users.setdefault(key, row)
+        self._messages[:0] = messages
+        self._events[:0] = events
+        for key, row in states.items():
+            # /start, пришедший после сбоя, отменяет старую ошибку
+            if key not in self._users:
+                self._states.setdefault(key, row)
+        self._pending += sum(starts.values()) + len(messages) + len(states)
+
+    async def _loop(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                await asyncio.sleep(self.flush_interval)
+
+    def start(self):
+        self._closing = False
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        # не отменяем задачу посреди записи — даём циклу доработать
+        self._closing = True
+        self._wake.set()
+        if self._task:
+            await self._task
+        self._task = None
+        # чистая остановка: всё, что в буфере, должно попасть в БД; если БД недоступна —
+        # остальное выключение (настройки, движок, HTTP-пул) всё равно должно пройти
+        try:
+            await self.flush()
+        except Exception:
+            log.error("Write-behind: %s pending records lost at shutdown", self._pending)
+
+
+bookkeeping = WriteBehind()
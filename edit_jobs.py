@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+from mirrorhub.config import (
+    CONTACT_EDIT_RATE_PER_TOKEN,
+    CONTACT_EDIT_WORKERS,
+    CONTACT_EDIT_CHECKPOINT_EVERY,
+    BROADCAST_PROGRESS_EVERY,
+)
+from mirrorhub.core.db import AsyncSessionLocal
+from mirrorhub.core.arepo import list_bot_sent_msgs, mark_sent_msgs
+from mirrorhub.core.settings_cache import settings
+from mirrorhub.send_limiter import retry_sink, send_priority, PRIORITY_BULK
+from mirrorhub.utils.rate_limit import TokenBucket
+
+log = logging.getLogger(__name__)
+
+# незаконченная правка переживает рестарт: текст лежит в настройках, пока задача не дойдёт до конца
+PENDING_KEY = "contact_edit_pending:{bot_id}"
+
+# одна правка на бота: новый /change_contact отменяет незаконченную
+_JOBS: dict[int, asyncio.Task] = {}
+
+# Telegram больше не даст отредактировать — повторять бессмысленно
+_GONE_ERRORS = ("message to edit not found", "message can't be edited", "message_id_invalid")
+
+
+def template_hash(text: str) -> str:
+    return hashlib.sha1((text or "").encode()).hexdigest()[:16]
+
+
+@dataclass
+class EditStats:
+    total: int = 0
+    ok: int = 0
+    fail: int = 0
+    gone: int = 0
+    retried: int = 0
+    started_at: float = 0.0
+
+    @property
+    def done(self) -> int:
+        return self.ok + self.fail + self.gone
+
+
+async def _edit(bot: Bot, chat_id: int, message_id: int, media: str | None, text: str):
+    if media == "photo":
+        await bot.edit_message_caption(chat_id=chat_id, message_id=message_id, caption=text, parse_mode="HTML")
+    elif media == "text":
+        await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, parse_mode="HTML")
+    else:
+        # старые записи без типа: пробуем оба варианта
+        try:
+            await bot.edit_message_caption(chat_id=chat_id, message_id=message_id, caption=text, parse_mode="HTML")
+        except TelegramBadRequest as e:
+            if "not modified" in str(e).lower():
+                raise
+            await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, parse_mode="HTML")
+
+
+async def _edit_one(bot: Bot, bucket: TokenBucket, row: tuple[int, int, int, str | None], text: str) -> str:
+    # -> ok / fail / gone; лимиты чата и повтор после 429 — в send_limiter
+    _id, chat_id, message_id, media = row
+    await bucket.acquire()
+    try:
+        await _edit(bot, chat_id, message_id, media, text)
+        return "ok"
+    except TelegramBadRequest as e:
+        err = str(e).lower()
+        # текст уже такой — цель достигнута
+        if "not modified" in err:
+            return "ok"
+        if any(g in err for g in _GONE_ERRORS):
+            return "gone"
+        return "fail"
+    except Exception:
+        return "fail"
+
+
+def render_edit_progress(stats: EditStats, finished: bool = False) -> str:
+    elapsed = max(time.monotonic() - stats.started_at, 0.001)
+    head = "✅ Шаблон обновлён, редактирование завершено." if finished else "✏️ Редактирую отправленные сообщения…"
+    return (
+        f"{head}\n"
+        f"Отредактировано: {stats.ok}/{stats.total}. Ошибок: {stats.fail}. Недоступны для правки: {stats.gone}.\n"
+        f"Повторов из-за флуд-лимита: {stats.retried}\n"
+        f"Скорость: {stats.done / elapsed:.1f} правок/с, прошло {int(elapsed)} с"
+    )
+
+
+async def _edit_status(status: Message | None, text: str):
+    if status is None:
+        return
+    try:
+        await status.edit_text(text)
+    except Exception:
+        pass
+
+
+async def run_contact_edit(bot: Bot, bot_id: int, text: str, status: Message | None = None) -> EditStats:
+    thash = template_hash(text)
+    # только то, что ещё показывает старый текст: после падения продолжаем с места остановки
+    async with AsyncSessionLocal() as db:
+        rows = await list_bot_sent_msgs(db, bot_id, "start_template", skip_hash=thash)
+    stats = EditStats(total=len(rows), started_at=time.monotonic())
+    bucket = TokenBucket(CONTACT_EDIT_RATE_PER_TOKEN)
+    queue = iter(rows)
+    edited: list[int] = []
+    gone: list[int] = []
+
+    async def checkpoint():
+        done, lost = edited[:], gone[:]
+        edited.clear()
+        gone.clear()
+        async with AsyncSessionLocal() as db:
+            await mark_sent_msgs(db, done, thash)
+            await mark_sent_msgs(db, lost, editable=False)
+
+    async def worker():
+        retry_sink.set(stats)
+        send_priority.set(PRIORITY_BULK)
+        for row in queue:
+            result = await _edit_one(bot, bucket, row, text)
+            if result == "ok":
+                stats.ok += 1
+                edited.append(row[0])
+            elif result == "gone":
+                stats.gone += 1
+                gone.append(row[0])
+            else:
+                stats.fail += 1
+            if len(edited) + len(gone) >= CONTACT_EDIT_CHECKPOINT_EVERY:
+                await checkpoint()
+
+    async def progress_loop():
+        last = None
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_EVERY)
+            snapshot = (stats.ok, stats.fail, stats.gone, stats.retried)
+            if snapshot != last:
+                last = snapshot
+                await _edit_status(status, render_edit_progress(stats))
+
+    progress = asyncio.create_task(progress_loop())
+    try:
+        workers = min(CONTACT_EDIT_WORKERS, len(rows)) or 1
+        await asyncio.gather(*(worker() for _ in range(workers)))
+    finally:
+        progress.cancel()
+        try:
+            await progress
+        except asyncio.CancelledError:
+            pass
+        # и при отмене сохраняем сделанное — следующий запуск это пропустит
+        await asyncio.shield(checkpoint())
+
+    await _edit_status(status, render_edit_progress(stats, finished=True))
+    log.info("Contact edit for bot %s: %s/%s ok, %s failed, %s gone",
+             bot_id, stats.ok, stats.total, stats.fail, stats.gone)
+    return stats
+
+
+async def _run_and_clear(bot: Bot, bot_id: int, text: str, status: Message | None):
+    await run_contact_edit(bot, bot_id, text, status)
+    key = PENDING_KEY.format(bot_id=bot_id)
+    if settings.get_str(key) == text:
+        await settings.set(key, "")
+
+
+async def start_contact_edit(bot: Bot, bot_id: int, text: str, status: Message | None = None) -> asyncio.Task:
+    prev = _JOBS.get(bot_id)
+    if prev and not prev.done():
+        prev.cancel()
+    await settings.set(PENDING_KEY.format(bot_id=bot_id), text)
+    task = asyncio.create_task(_run_and_clear(bot, bot_id, text, status), name=f"contact-edit-{bot_id}")
+    _JOBS[bot_id] = task
+    task.add_done_callback(lambda t: _JOBS.pop(bot_id, None) if _JOBS.get(bot_id) is t else None)
+    return task
+
+
+async def resume_contact_edit(bot: Bot, bot_id: int) -> asyncio.Task | None:
+    text = settings.get_str(PENDING_KEY.format(bot_id=bot_id))
+    if not text or bot_id in _JOBS:
+        return None
+    log.info("Resuming unfinished contact edit for bot %s", bot_id)
+    return await start_contact_edit(bot, bot_id, text)
@@ -0,0 +1,120 @@
+from dataclasses import dataclass
+
+from aiohttp import ClientSession, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram import Bot, __version__ as aiogram_version
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.enums import ParseMode
+
+from mirrorhub.config import HTTP_POOL_LIMIT, HTTP_POOL_LIMIT_PER_HOST, HTTP_KEEPALIVE_TIMEOUT
+from mirrorhub.send_limiter import send_limiter, PRIORITY_NAMES, LatencyWindow
+
+
+@dataclass
+class PoolCounters:
+    created: int = 0
+    reused: int = 0
+    requests: int = 0
+
+
+class PooledSession(AiohttpSession):
+    # Один ClientSession с keep-alive на весь процесс; его делят все Bot().
+    def __init__(self, limit: int = HTTP_POOL_LIMIT, limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+                 keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT, **kwargs):
+        super().__init__(limit=limit, **kwargs)
+        self._connector_init.update(limit_per_host=limit_per_host, keepalive_timeout=keepalive_timeout)
+        self.counters = PoolCounters()
+
+    def _trace_config(self) -> TraceConfig:
+        trace = TraceConfig()
+
+        async def on_request_start(_session, _ctx, _params):
+            self.counters.requests += 1
+
+        async def on_create(_session, _ctx, _params):
+            self.counters.created += 1
+
+        async def on_reuse(_session, _ctx, _params):
+            self.counters.reused += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        return trace
+
+    async def create_session(self) -> ClientSession:
+        # как в AiohttpSession.create_session, плюс trace_configs: их задают только
+        # при создании ClientSession, поэтому super() не подходит
+        if self._should_reset_connector:
+            # сменили прокси — пул пересоздаётся; self.close() общий пул не закрывает
+            await super().close()
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"},
+                trace_configs=[self._trace_config()],
+            )
+            self._should_reset_connector = False
+        return self._session
+
+    async def close(self):
+        # bot.session.close() по всему коду не должен рвать общий пул
+        pass
+
+    async def shutdown(self):
+        await super().close()
+
+    def stats(self) -> dict[str, int]:
+        open_conns = idle = in_use = 0
+        if self._session is not None and not self._session.closed:
+            conn = self._session.connector
+            idle = sum(len(v) for v in getattr(conn, "_conns", {}).values())
+            in_use = len(getattr(conn, "_acquired", ()))
+            open_conns = idle + in_use
+        return {
+            "open": open_conns,
+            "idle": idle,
+            "in_use": in_use,
+            "created": self.counters.created,
+            "reused": self.counters.reused,
+            "requests": self.counters.requests,
+        }
+
+
+http_session = PooledSession()
+# лимиты Bot API и повтор после 429 — для всех ботов, созданных через make_bot
+http_session.middleware(send_limiter)
+
+
+def make_bot(token: str, parse_mode: ParseMode | None = ParseMode.HTML) -> Bot:
+    return Bot(token, session=http_session, default=DefaultBotProperties(parse_mode=parse_mode))
+
+
+def _render_latency(window: LatencyWindow) -> str:
+    p50, p99 = window.percentile(0.5), window.percentile(0.99)
+    if p50 is None:
+        return "нет замеров"
+    return f"p50 {p50 * 1000:.0f} мс, p99 {p99 * 1000:.0f} мс (n={len(window.samples)})"
+
+
+def render_pool_stats() -> str:
+    st = http_session.stats()
+    lim = send_limiter.stats()
+    busiest = ", ".join(f"#{bot_id}: {n}" for bot_id, n in lim["busiest"]) or "—"
+    return (
+        "🌐 HTTP-пул\n"
+        f"Открыто соединений: {st['open']} (в работе: {st['in_use']}, простаивают: {st['idle']})\n"
+        f"Создано: {st['created']}, переиспользовано: {st['reused']}\n"
+        f"Запросов: {st['requests']}\n\n"
+        "🚦 Лимиты отправки\n"
+        f"Токенов: {lim['tokens']}, отправлено: {lim['sent']}, повторов после 429: {lim['retried']}\n"
+        f"В очереди сейчас: {lim['waiting']} (больше всего — {busiest})\n"
+        f"Ждут слота по классам: " + ", ".join(
+            f"{name} {n}" for name, n in zip(PRIORITY_NAMES, lim["by_class"])
+        ) + "\n\n"
+        "⏱ Ответ на /start\n"
+        f"Во время рассылок: {_render_latency(send_limiter.start_latency['bulk'])}\n"
+        f"Без рассылок: {_render_latency(send_limiter.start_latency['idle'])}"
+    )
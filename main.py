@@ -3,30 +3,74 @@ import asyncio
 import logging
 import re
 from aiogram import Bot
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
 from aiogram.types import ErrorEvent
 
 from mirrorhub.core.repo import init_db
-from mirrorhub.central_bot import get_dp
-from mirrorhub.config import CENTRAL_BOT_TOKEN, SUPERADMINS, DB_PATH
+from mirrorhub.core.write_behind import bookkeeping
+from mirrorhub.core.settings_cache import settings
+from mirrorhub.core.db import async_engine
+from mirrorhub.central_bot import get_dp, restore_running_mirrors
+from mirrorhub.config import CENTRAL_BOT_TOKEN, SUPERADMINS, DB_PATH, MIRROR_WEBHOOK_ENABLED
+from mirrorhub.mirror_fleet import fleet, webhook_server
+from mirrorhub.http_pool import http_session, make_bot
+from mirrorhub.token_pool import token_health_loop
+from mirrorhub.broadcast_jobs import broadcast_jobs
+from mirrorhub.broadcast import user_readmit_loop
 
 TOKEN_RE = re.compile(r'^\d{6,12}:[A-Za-z0-9_-]{35,}$')
 
+_BACKGROUND: list[asyncio.Task] = []
+
 async def on_startup(bot: Bot):
+    bookkeeping.start()
+    broadcast_jobs.bind(bot)
+    settings.start()
+    if MIRROR_WEBHOOK_ENABLED:
+        await webhook_server.start()
+    _BACKGROUND.append(asyncio.create_task(token_health_loop()))
+    _BACKGROUND.append(asyncio.create_task(user_readmit_loop()))
     me = await bot.get_me()
     logging.info("Central bot started as @%s (id=%s)", me.username, me.id)
     logging.info("DB path: %s", DB_PATH)
     text = f"✅ Центральный бот запущен: @{me.username} ({me.id})"
+    await _notify_admins(bot, text)
+    # зеркала поднимаем в фоне, чтобы центральный бот начал отвечать сразу
+    asyncio.create_task(_restore_mirrors(bot))
+
+async def _notify_admins(bot: Bot, text: str):
     for admin_id in SUPERADMINS:
         try:
             await bot.send_message(admin_id, text)
         except Exception as e:
             logging.warning("Can't notify admin %s: %s", admin_id, e)
 
+async def _restore_mirrors(bot: Bot):
+    try:
+        summary = await restore_running_mirrors()
+    except Exception as e:
+        logging.exception("Mirror restore failed")
+        summary = f"⚠️ Восстановление зеркал не удалось: {type(e).__name__}: {e}"
+    await _notify_admins(bot, summary)
+    # аудитория рассылок — запущенные зеркала, поэтому продолжаем после их подъёма
+    resumed = await broadcast_jobs.resume_all()
+    if resumed:
+        await _notify_admins(bot, f"📣 Продолжены незавершённые рассылки: {resumed}")
+
 async def on_shutdown(bot: Bot):
     logging.info("Central bot shutdown")
-    await bot.session.close()
+    for task in _BACKGROUND:
+        task.cancel()
+    await asyncio.gather(*_BACKGROUND, return_exceptions=True)
+    # сначала зеркала перестают брать апдейты и дописывают начатые /start,
+    # только потом финальный сброс write-behind — иначе поздние старты теряются
+    await fleet.drain()
+    if MIRROR_WEBHOOK_ENABLED:
+        await webhook_server.stop()
+    await broadcast_jobs.stop()
+    await bookkeeping.stop()
+    await settings.stop()
+    await async_engine.dispose()
+    await http_session.shutdown()
 
 async def on_error(event: ErrorEvent):
     logging.exception("Unhandled error in handler: %s", event.exception)
@@ -43,7 +87,7 @@ async def main():
     dp.shutdown.register(on_shutdown)
     dp.errors.register(on_error)
 
-    bot = Bot(token=CENTRAL_BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot = make_bot(CENTRAL_BOT_TOKEN)
     logging.info("Starting polling…")
     await dp.start_polling(bot, allowed_updates=["message", "callback_query"])
 
@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import logging
+import os
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+
+from mirrorhub.config import SUPERADMINS
+from mirrorhub.http_pool import make_bot
+from mirrorhub.core.db import AsyncSessionLocal
+from mirrorhub.core.arepo import (
+    get_media_file_id, save_media_file_id, delete_media_file_id, delete_media_by_hash,
+)
+
+log = logging.getLogger(__name__)
+
+# (path, mtime_ns, size) -> sha256, чтобы не читать JPEG на каждый /start
+_HASHES: dict[tuple[str, int, int], str] = {}
+# (token, file_hash) -> file_id
+_FILE_IDS: dict[tuple[str, str], str] = {}
+_UPLOAD_LOCKS: dict[tuple[str, str], asyncio.Lock] = {}
+
+
+def file_hash(path: str) -> str:
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    h = _HASHES.get(key)
+    if h is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+        h = digest.hexdigest()
+        _HASHES[key] = h
+    return h
+
+
+async def _cached_file_id(token: str, fhash: str) -> str | None:
+    key = (token, fhash)
+    if key not in _FILE_IDS:
+        async with AsyncSessionLocal() as db:
+            fid = await get_media_file_id(db, token, fhash)
+        if fid:
+            _FILE_IDS[key] = fid
+    return _FILE_IDS.get(key)
+
+
+async def _remember(token: str, fhash: str, msg: Message | None):
+    if not msg or not msg.photo:
+        return
+    fid = msg.photo[-1].file_id
+    _FILE_IDS[(token, fhash)] = fid
+    async with AsyncSessionLocal() as db:
+        await save_media_file_id(db, token, fhash, fid)
+
+
+async def _forget(token: str, fhash: str):
+    _FILE_IDS.pop((token, fhash), None)
+    async with AsyncSessionLocal() as db:
+        await delete_media_file_id(db, token, fhash)
+
+
+async def send_photo_cached(bot: Bot, chat_id: int, path: str, **kwargs) -> Message:
+    fhash = file_hash(path)
+    key = (bot.token, fhash)
+
+    fid = await _cached_file_id(*key)
+    if fid:
+        try:
+            return await bot.send_photo(chat_id=chat_id, photo=fid, **kwargs)
+        except TelegramBadRequest as e:
+            if "file" not in str(e).lower():
+                raise
+            # file_id протух (например, токен пересоздан) — загрузим заново
+            await _forget(*key)
+
+    # первая загрузка на этот токен: остальные ждут и берут готовый file_id
+    lock = _UPLOAD_LOCKS.setdefault(key, asyncio.Lock())
+    async with lock:
+        fid = _FILE_IDS.get(key)
+        if fid:
+            return await bot.send_photo(chat_id=chat_id, photo=fid, **kwargs)
+        msg = await bot.send_photo(chat_id=chat_id, photo=FSInputFile(path), **kwargs)
+        await _remember(bot.token, fhash, msg)
+        return msg
+
+
+async def invalidate_photo(path: str | None):
+    if not path or not os.path.isfile(path):
+        return
+    fhash = file_hash(path)
+    for key in [k for k in _FILE_IDS if k[1] == fhash]:
+        _FILE_IDS.pop(key, None)
+    async with AsyncSessionLocal() as db:
+        await delete_media_by_hash(db, fhash)
+
+
+async def _warm_one(token: str, path: str, service_chats: list[int]) -> bool:
+    fhash = file_hash(path)
+    if await _cached_file_id(token, fhash):
+        return True
+    bot = make_bot(token, parse_mode=None)
+    try:
+        # загружаем в служебный чат (владелец/суперадмин) и сразу удаляем
+        for chat_id in service_chats:
+            try:
+                msg = await bot.send_photo(chat_id=chat_id, photo=FSInputFile(path), disable_notification=True)
+            except Exception:
+                continue
+            await _remember(token, fhash, msg)
+            try:
+                await bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
+            except Exception:
+                pass
+            return True
+        return False
+    finally:
+        await bot.session.close()
+
+
+async def warm_fleet(path: str, tokens: list[str], owner_id: int | None = None):
+    if not path or not os.path.isfile(path):
+        return
+    service_chats = ([owner_id] if owner_id else []) + [a for a in SUPERADMINS if a != owner_id]
+    results = await asyncio.gather(
+        *(_warm_one(t, path, service_chats) for t in tokens), return_exceptions=True
+    )
+    ok = sum(1 for r in results if r is True)
+    # у кого не вышло — file_id появится при первом /start
+    log.info("Media cache warmed for %s/%s bots (%s)", ok, len(tokens), path)
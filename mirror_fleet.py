@@ -0,0 +1,185 @@
+import asyncio
+import logging
+
+import aiohttp
+from typing import Any, Awaitable, Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import (
+    TelegramConflictError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+    TelegramUnauthorizedError,
+)
+from aiogram.types import ErrorEvent, TelegramObject
+
+from mirrorhub.config import MIRROR_POLL_TIMEOUT, MIRROR_POLL_BACKOFF_MAX, MIRROR_WEBHOOK_ENABLED
+from mirrorhub.mirror_bot import setup_handlers
+from mirrorhub.send_limiter import send_priority, PRIORITY_INTERACTIVE
+from mirrorhub.webhook_server import WebhookServer, secret_for, webhook_url
+
+log = logging.getLogger(__name__)
+
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+
+def classify_failure(exc: BaseException | None) -> str:
+    # unauthorized — токен мёртв; conflict — кто-то ещё читает апдейты этого бота;
+    # network — временная проблема связи/сервера Telegram
+    if isinstance(exc, TelegramUnauthorizedError):
+        return "unauthorized"
+    if isinstance(exc, TelegramConflictError):
+        return "conflict"
+    if isinstance(exc, (TelegramNetworkError, TelegramServerError, TelegramRetryAfter,
+                        aiohttp.ClientError, asyncio.TimeoutError, OSError)):
+        return "network"
+    return "other"
+
+
+class MirrorFleet:
+    # Один Dispatcher на все зеркала: хендлеры регистрируются один раз,
+    # bot_id подставляется по токену входящего бота.
+    def __init__(self):
+        self.dp = Dispatcher()
+        setup_handlers(self.dp)
+        self.dp.update.outer_middleware(self._inject_bot_id)
+        self.dp.errors.register(self._on_error)
+        self._bot_ids: dict[str, int] = {}
+        self._bots: dict[int, Bot] = {}
+        self._polling: dict[int, asyncio.Task] = {}
+        self._handling: set[asyncio.Task] = set()
+        self._ready: dict[int, asyncio.Event] = {}
+        self.last_failure: dict[int, tuple[str, str]] = {}
+
+    async def _inject_bot_id(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        bot_id = self._bot_ids.get(data["bot"].token)
+        if bot_id is None:
+            # апдейт от уже отключённого бота
+            return None
+        data["bot_id"] = bot_id
+        # апдейт обрабатывается в своей задаче — класс не утечёт в другие отправки
+        send_priority.set(PRIORITY_INTERACTIVE)
+        return await handler(event, data)
+
+    async def _on_error(self, event: ErrorEvent) -> bool:
+        log.error("Unhandled error in mirror handler: %s", event.exception, exc_info=event.exception)
+        return True
+
+    def bot_id_for(self, token: str) -> int | None:
+        return self._bot_ids.get(token)
+
+    def get_bot(self, bot_id: int) -> Bot | None:
+        return self._bots.get(bot_id)
+
+    def register(self, bot_id: int, bot: Bot):
+        old = self._bots.get(bot_id)
+        if old is not None and old.token != bot.token:
+            self._bot_ids.pop(old.token, None)
+        self._bots[bot_id] = bot
+        self._bot_ids[bot.token] = bot_id
+
+    def unregister(self, bot_id: int) -> Bot | None:
+        bot = self._bots.pop(bot_id, None)
+        if bot is not None:
+            self._bot_ids.pop(bot.token, None)
+        return bot
+
+    async def attach(self, bot_id: int, bot: Bot) -> asyncio.Task | None:
+        self.register(bot_id, bot)
+        self._ready[bot_id] = asyncio.Event()
+        if MIRROR_WEBHOOK_ENABLED:
+            # апдейты придут на общий webhook-сервер, своего цикла у бота нет
+            await bot.set_webhook(
+                url=webhook_url(bot_id, bot.token),
+                secret_token=secret_for(bot_id, bot.token),
+                allowed_updates=ALLOWED_UPDATES,
+            )
+            self._ready[bot_id].set()
+            return None
+        # на случай, если раньше бот работал через webhook — иначе getUpdates даст Conflict
+        await bot.delete_webhook(drop_pending_updates=False)
+        # Telegram принял токен — бот готов; первый getUpdates может висеть весь long-poll
+        self._ready[bot_id].set()
+        task = asyncio.create_task(self._poll(bot), name=f"mirror-poll-{bot_id}")
+        self._polling[bot_id] = task
+        return task
+
+    async def detach(self, bot_id: int) -> Bot | None:
+        task = self._polling.pop(bot_id, None)
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._ready.pop(bot_id, None)
+        bot = self.unregister(bot_id)
+        if bot is not None and MIRROR_WEBHOOK_ENABLED:
+            try:
+                await bot.delete_webhook(drop_pending_updates=False)
+            except Exception:
+                # токен уже может быть забанен — снимать нечего
+                pass
+        return bot
+
+    async def drain(self):
+        # остановка процесса: новых апдейтов не берём, начатые дообрабатываем.
+        # is_running в БД не трогаем — при следующем старте зеркала поднимутся снова
+        await asyncio.gather(*(self.detach(bot_id) for bot_id in list(self._bots)), return_exceptions=True)
+        while self._handling:
+            await asyncio.gather(*list(self._handling), return_exceptions=True)
+
+    async def feed(self, bot: Bot, update) -> Any:
+        return await self.dp.feed_update(bot, update)
+
+    def dispatch(self, bot: Bot, update):
+        task = asyncio.create_task(self.feed(bot, update))
+        self._handling.add(task)
+        task.add_done_callback(self._handling.discard)
+
+    def _ready_event(self, bot_id: int) -> asyncio.Event:
+        return self._ready.setdefault(bot_id, asyncio.Event())
+
+    async def wait_ready(self, bot_id: int, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._ready_event(bot_id).wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _poll(self, bot: Bot):
+        bot_id = self._bot_ids.get(bot.token)
+        offset: int | None = None
+        backoff = 1.0
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset,
+                    timeout=MIRROR_POLL_TIMEOUT,
+                    allowed_updates=ALLOWED_UPDATES,
+                    request_timeout=MIRROR_POLL_TIMEOUT + 10,
+                )
+            except Exception as e:
+                kind = classify_failure(e)
+                self.last_failure[bot_id] = (kind, f"{type(e).__name__}: {e}")
+                if kind == "unauthorized":
+                    # токен отозван/забанен — решает MirrorRunner
+                    raise
+                log.warning("Polling %s error for bot %s: %s", kind, bot_id, e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MIRROR_POLL_BACKOFF_MAX)
+                continue
+            backoff = 1.0
+            for update in updates:
+                offset = update.update_id + 1
+                self.dispatch(bot, update)
+
+
+fleet = MirrorFleet()
+webhook_server = WebhookServer(fleet)
@@ -1,79 +1,152 @@
-
 import asyncio
-from aiogram import Bot, Dispatcher
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
+import logging
+import time
+from aiogram import Bot
 from aiogram.exceptions import TelegramUnauthorizedError
 
-from sqlalchemy import select
-from mirrorhub.core.models import Token, BotInstance
-from mirrorhub.core.repo import set_bot_meta, set_bot_running, mark_token_status
-from mirrorhub.core.db import SessionLocal
+from mirrorhub.config import MIRROR_WEBHOOK_ENABLED, MIRROR_HEARTBEAT_INTERVAL, MIRROR_SWAP_READY_TIMEOUT
+from mirrorhub.core.arepo import (
+    set_bot_meta, set_bot_running, set_bot_error, mark_token_status, get_bot, get_bot_token, record_token_swap,
+)
+from mirrorhub.core.db import AsyncSessionLocal
 from mirrorhub.token_pool import replace_dead_token
-from mirrorhub.mirror_bot import setup_handlers
+from mirrorhub.mirror_fleet import fleet, classify_failure
+from mirrorhub.http_pool import make_bot
+from mirrorhub.edit_jobs import resume_contact_edit
+
+log = logging.getLogger(__name__)
 
 class MirrorRunner:
     def __init__(self, bot_id: int, token: str):
         self.bot_id = bot_id
         self.token = token
         self.bot: Bot | None = None
-        self.dp: Dispatcher | None = None
         self.task: asyncio.Task | None = None
+        self._heartbeat: asyncio.Task | None = None
+        self._swap: asyncio.Task | None = None
+        self._stopping = False
+
+    @property
+    def alive(self) -> bool:
+        # упавший опрос или неудавшаяся замена токена оставляют раннер без бота в диспетчере
+        if self._stopping:
+            return False
+        if self._swap is not None and not self._swap.done():
+            return True
+        if self.task is not None:
+            return not self.task.done()
+        return fleet.get_bot(self.bot_id) is not None
 
     async def start(self):
-        self.bot = Bot(self.token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-        self.dp = Dispatcher()
-        setup_handlers(self.dp, self.bot_id)
+        self._stopping = False
+        self.bot = make_bot(self.token)
         try:
             me = await self.bot.get_me()
             username = me.username or ""
             link = f"https://t.me/{username}" if username else ""
-            with SessionLocal() as db:
-                set_bot_meta(db, self.bot_id, username, link)
-                set_bot_running(db, self.bot_id, True, None)
+            async with AsyncSessionLocal() as db:
+                await set_bot_meta(db, self.bot_id, username, link)
+                await set_bot_running(db, self.bot_id, True, None)
         except TelegramUnauthorizedError:
-            with SessionLocal() as db:
-                old_token_id = db.execute(
-                    select(BotInstance.token_id).where(BotInstance.id == self.bot_id)
-                ).scalars().first()
-                if old_token_id:
-                    mark_token_status(db, old_token_id, "banned")
-                await replace_dead_token(db, self.bot_id, banned_old_token_id=old_token_id)
-            return await self.restart_with_new_token()
-
-        self.task = asyncio.create_task(
-            self.dp.start_polling(self.bot, allowed_updates=["message", "callback_query"])
-        )
+            return await self.swap_token(time.monotonic())
 
-    async def restart_with_new_token(self):
-        with SessionLocal() as db:
-            token_value = db.execute(
-                select(Token.token)
-                .join(BotInstance, BotInstance.token_id == Token.id)
-                .where(BotInstance.id == self.bot_id)
-            ).scalars().first()
-            if not token_value:
+        await self._attach()
+        # /change_contact, прерванный рестартом, доделывается с места остановки
+        await resume_contact_edit(self.bot, self.bot_id)
+
+    async def _attach(self):
+        # общий диспетчер зеркал: остальные боты не перезапускаются
+        self.task = await fleet.attach(self.bot_id, self.bot)
+        if self.task is not None:
+            self.task.add_done_callback(self._on_polling_done)
+        elif MIRROR_WEBHOOK_ENABLED and (self._heartbeat is None or self._heartbeat.done()):
+            # в webhook-режиме цикла опроса нет — отзыв токена ловим периодическим getMe
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    def _on_polling_done(self, task: asyncio.Task):
+        if self._stopping or task.cancelled() or task is not self.task:
+            return
+        exc = task.exception()
+        kind = classify_failure(exc)
+        if kind == "unauthorized":
+            log.warning("Bot #%s: token revoked during polling, swapping", self.bot_id)
+            self._start_swap(time.monotonic())
+        else:
+            # сетевые ошибки и конфликты _poll переживает сам; сюда попадает только неожиданное
+            log.error("Bot #%s: polling stopped (%s): %s", self.bot_id, kind, exc)
+            self._swap = asyncio.create_task(self._mark_failed(f"{kind}: {type(exc).__name__}: {exc}"))
+
+    async def _mark_failed(self, error: str):
+        await fleet.detach(self.bot_id)
+        async with AsyncSessionLocal() as db:
+            await set_bot_running(db, self.bot_id, False, error)
+
+    async def _heartbeat_loop(self):
+        while not self._stopping:
+            await asyncio.sleep(MIRROR_HEARTBEAT_INTERVAL)
+            try:
+                await self.bot.get_me()
+            except TelegramUnauthorizedError:
+                self._start_swap(time.monotonic())
                 return
-            self.token = token_value
+            except Exception:
+                pass
+
+    def _start_swap(self, detected_at: float):
+        if self._swap is None or self._swap.done():
+            self._swap = asyncio.create_task(self.swap_token(detected_at))
+
+    async def swap_token(self, detected_at: float):
+        # бан обнаружен: сразу снимаем бота с диспетчера, берём проверенный токен из пула
+        await fleet.detach(self.bot_id)
+        async with AsyncSessionLocal() as db:
+            b = await get_bot(db, self.bot_id)
+            old_token_id = b.token_id if b else None
+            if old_token_id:
+                await mark_token_status(db, old_token_id, "banned")
+        ok, _info = await replace_dead_token(self.bot_id, banned_old_token_id=old_token_id)
+        if not ok or self._stopping:
+            return
+        await self.restart_with_new_token()
+
+        # простой считаем от обнаружения бана до первого успешного getUpdates/setWebhook
+        if await fleet.wait_ready(self.bot_id, MIRROR_SWAP_READY_TIMEOUT):
+            latency_ms = int((time.monotonic() - detected_at) * 1000)
+            async with AsyncSessionLocal() as db:
+                await record_token_swap(db, self.bot_id, latency_ms)
+            log.info("Bot #%s: token swapped in %s ms", self.bot_id, latency_ms)
+
+    async def restart_with_new_token(self):
+        async with AsyncSessionLocal() as db:
+            token_value = await get_bot_token(db, self.bot_id)
+        if not token_value:
+            return
+        self.token = token_value
+        await fleet.detach(self.bot_id)
         if self.bot:
             await self.bot.session.close()
-        self.bot = Bot(self.token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-        self.dp = Dispatcher()
-        setup_handlers(self.dp, self.bot_id)
-        self.task = asyncio.create_task(
-            self.dp.start_polling(self.bot, allowed_updates=["message", "callback_query"])
-        )
+        self.bot = make_bot(self.token)
+        await self._attach()
 
-    async def stop(self):
-        if self.task and not self.task.done():
-            self.task.cancel()
-            try:
-                await self.task
-            except asyncio.CancelledError:
-                pass
-        if self.dp:
-            await self.dp.storage.close()
+    async def detach(self):
+        # снять с диспетчера без записи в БД
+        self._stopping = True
+        for task in (self._heartbeat, self._swap):
+            if task and not task.done() and task is not asyncio.current_task():
+                task.cancel()
+        await fleet.detach(self.bot_id)
+        self.task = None
         if self.bot:
             await self.bot.session.close()
-        with SessionLocal() as db:
-            set_bot_running(db, self.bot_id, False, None)
+
+    async def abandon(self, error: str):
+        # неудачный старт (сеть, таймаут): is_running остаётся — зеркало не выпадает
+        # из восстановления и аудитории рассылок, причина видна в last_error
+        await self.detach()
+        async with AsyncSessionLocal() as db:
+            await set_bot_error(db, self.bot_id, error)
+
+    async def stop(self):
+        await self.detach()
+        async with AsyncSessionLocal() as db:
+            await set_bot_running(db, self.bot_id, False, None)
@@ -0,0 +1,151 @@
+import logging
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+from mirrorhub.config import (
+    SEND_RATE_PER_TOKEN,
+    SEND_PRIVATE_CHAT_INTERVAL,
+    SEND_GROUP_CHAT_INTERVAL,
+    SEND_MAX_RETRIES,
+    SEND_RETRY_JITTER,
+    SEND_PRIORITY_WEIGHTS,
+    SEND_BULK_ACTIVE_WINDOW,
+)
+from mirrorhub.utils.rate_limit import PriorityBucket, ChatThrottle
+
+log = logging.getLogger(__name__)
+
+# Классы отправки: ответы пользователям зеркал, уведомления админам,
+# уведомления о замене зеркала, рассылки и массовые правки
+PRIORITY_INTERACTIVE = 0
+PRIORITY_ADMIN = 1
+PRIORITY_REPLACEMENT = 2
+PRIORITY_BULK = 3
+PRIORITY_NAMES = ("ответы", "админ", "замены", "рассылки")
+
+# класс задаётся там, где начинается работа (хендлер зеркала, воркер рассылки);
+# по умолчанию — центральный бот и фоновые уведомления
+send_priority: ContextVar[int] = ContextVar("send_priority", default=PRIORITY_ADMIN)
+
+# сюда (объект с полем retried) считаются повторы после 429 — статистика рассылки/правки;
+# выставляется в задаче-воркере, транспорт видит её через контекст
+retry_sink: ContextVar[Any | None] = ContextVar("retry_sink", default=None)
+
+
+class _TokenLimits:
+    def __init__(self):
+        self.bucket = PriorityBucket(SEND_RATE_PER_TOKEN, SEND_PRIORITY_WEIGHTS)
+        self.private = ChatThrottle(SEND_PRIVATE_CHAT_INTERVAL)
+        self.group = ChatThrottle(SEND_GROUP_CHAT_INTERVAL)
+        self.waiting = 0
+        self.sent = 0
+        self.retried = 0
+
+
+class LatencyWindow:
+    # последние size замеров, сек
+    def __init__(self, size: int = 1000):
+        self.samples: deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class SendLimiter(BaseRequestMiddleware):
+    # Лимиты Bot API на уровне транспорта. Все Bot() ходят через общий http_session,
+    # поэтому /start, рассылки, правки и уведомления делят один бюджет токена,
+    # а 429 от любого из них притормаживает все остальные. Слоты токена раздаются
+    # по классам send_priority: ответ на /start не ждёт за тысячами сообщений рассылки.
+    def __init__(self, max_retries: int = SEND_MAX_RETRIES, jitter: float = SEND_RETRY_JITTER):
+        self.max_retries = max_retries
+        self.jitter = jitter
+        self._tokens: dict[int, _TokenLimits] = {}
+        self._last_bulk_at = 0.0
+        # время ответа на /start: отдельно — пока идут рассылки/правки, отдельно — в тишине
+        self.start_latency = {"idle": LatencyWindow(), "bulk": LatencyWindow()}
+
+    def bulk_active(self) -> bool:
+        return time.monotonic() - self._last_bulk_at < SEND_BULK_ACTIVE_WINDOW
+
+    def record_start_latency(self, seconds: float):
+        self.start_latency["bulk" if self.bulk_active() else "idle"].add(seconds)
+
+    def _limits(self, bot_id: int) -> _TokenLimits:
+        lim = self._tokens.get(bot_id)
+        if lim is None:
+            lim = self._tokens[bot_id] = _TokenLimits()
+        return lim
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # getUpdates, getMe, answerCallbackQuery и т.п. — вне лимитов отправки
+            return await make_request(bot, method)
+        lim = self._limits(bot.id)
+        priority = send_priority.get()
+        if priority == PRIORITY_BULK:
+            self._last_bulk_at = time.monotonic()
+        throttle = lim.private if isinstance(chat_id, int) and chat_id > 0 else lim.group
+        for attempt in range(self.max_retries + 1):
+            lim.waiting += 1
+            try:
+                # сначала чат, потом токен: пока ждём чат, бюджет токена не занят
+                await throttle.wait(chat_id)
+                await lim.bucket.acquire(priority)
+            finally:
+                lim.waiting -= 1
+            try:
+                response = await make_request(bot, method)
+                lim.sent += 1
+                return response
+            except TelegramRetryAfter as e:
+                # молчит весь токен; разброс — чтобы ожидавшие не ударили разом
+                lim.bucket.pause(e.retry_after + random.uniform(0, self.jitter))
+                lim.retried += 1
+                sink = retry_sink.get()
+                if sink is not None:
+                    sink.retried += 1
+                if attempt >= self.max_retries:
+                    raise
+                log.info("Bot %s: 429 on %s, retry in %ss", bot.id, type(method).__name__, e.retry_after)
+
+    def stats(self) -> dict[str, Any]:
+        busiest = sorted(
+            ((bot_id, lim.waiting) for bot_id, lim in self._tokens.items() if lim.waiting),
+            key=lambda x: x[1], reverse=True,
+        )
+        by_class = [0] * len(SEND_PRIORITY_WEIGHTS)
+        for lim in self._tokens.values():
+            for i, n in enumerate(lim.bucket.waiting()):
+                by_class[i] += n
+        return {
+            "tokens": len(self._tokens),
+            "waiting": sum(lim.waiting for lim in self._tokens.values()),
+            "by_class": by_class,
+            "sent": sum(lim.sent for lim in self._tokens.values()),
+            "retried": sum(lim.retried for lim in self._tokens.values()),
+            "busiest": busiest[:5],
+        }
+
+
+send_limiter = SendLimiter()
@@ -5,8 +5,9 @@ from pathlib import Path
 from telethon import TelegramClient
 from telethon.errors import SessionPasswordNeededError
 from mirrorhub.config import SESSIONS_DIR, TELETHON_SESSION_NAME
-from mirrorhub.core.repo import set_setting, get_setting
-from mirrorhub.core.db import SessionLocal
+from mirrorhub.core.arepo import set_setting, get_setting
+from mirrorhub.core.db import AsyncSessionLocal
+from mirrorhub.core.settings_cache import settings
 
 API_ID_SETTING = "telethon_api_id"
 API_HASH_SETTING = "telethon_api_hash"
@@ -29,9 +30,9 @@ class TelethonManager:
         self.client: TelegramClient | None = None
 
     async def login_dialog(self, send_text):
-        with SessionLocal() as db:
-            api_id = get_setting(db, API_ID_SETTING)
-            api_hash = get_setting(db, API_HASH_SETTING)
+        async with AsyncSessionLocal() as db:
+            api_id = await get_setting(db, API_ID_SETTING)
+            api_hash = await get_setting(db, API_HASH_SETTING)
 
         if not api_id:
             await send_text("Отправь <b>API_ID</b>:")
@@ -40,9 +41,9 @@ class TelethonManager:
             await send_text("Отправь <b>API_HASH</b>:")
             api_hash = (await self._wait_input()).strip()
 
-        with SessionLocal() as db:
-            set_setting(db, API_ID_SETTING, api_id)
-            set_setting(db, API_HASH_SETTING, api_hash)
+        async with AsyncSessionLocal() as db:
+            await set_setting(db, API_ID_SETTING, api_id)
+            await set_setting(db, API_HASH_SETTING, api_hash)
 
 
         self.client = TelegramClient(_session_name_str(), int(api_id), api_hash)
@@ -64,8 +65,7 @@ class TelethonManager:
                 await self.client.sign_in(password=password)
 
         me = await self.client.get_me()
-        with SessionLocal() as db:
-            set_setting(db, OWNER_ID_SETTING, str(me.id))
+        await settings.set(OWNER_ID_SETTING, str(me.id))
 
 
         await self.client.disconnect()
@@ -76,9 +76,9 @@ class TelethonManager:
         p = _session_file_path()
         exists = p.exists()
 
-        with SessionLocal() as db:
-            api_id = get_setting(db, API_ID_SETTING)
-            api_hash = get_setting(db, API_HASH_SETTING)
+        async with AsyncSessionLocal() as db:
+            api_id = await get_setting(db, API_ID_SETTING)
+            api_hash = await get_setting(db, API_HASH_SETTING)
 
         owner_id = None
         username = None
@@ -117,8 +117,7 @@ class TelethonManager:
                     f.unlink()
             except Exception:
                 pass
-        with SessionLocal() as db:
-            set_setting(db, OWNER_ID_SETTING, None)
+        await settings.set(OWNER_ID_SETTING, None)
 
 
     async def _wait_input(self) -> str:
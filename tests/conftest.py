@@ -0,0 +1,36 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# корень репозитория — это сам пакет mirrorhub (импорты вида mirrorhub.core...),
+# а лежит он в каталоге с другим именем
+if "mirrorhub" not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        "mirrorhub", ROOT / "__init__.py", submodule_search_locations=[str(ROOT)],
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["mirrorhub"] = module
+    spec.loader.exec_module(module)
+
+
+@pytest.fixture
+def temp_db(tmp_path):
+    # отдельная SQLite на тест: схема из моделей, те же PRAGMA, что в core/db.py
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from mirrorhub.core.db import Base, _sqlite_pragmas
+    from mirrorhub.core import models  # noqa: F401 — регистрирует таблицы
+
+    path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite:///{path}", future=True)
+    event.listen(engine, "connect", _sqlite_pragmas)
+    Base.metadata.create_all(bind=engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=20, max_overflow=100)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+    yield engine, async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    engine.dispose()
+    async_engine.sync_engine.dispose()
@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from mirrorhub.core import arepo
+from mirrorhub.core.models import BotInstance, BotUser, Token
+
+
+def _seed(engine):
+    # два запущенных зеркала; у второго токен заменили час назад
+    now = datetime.utcnow()
+    with Session(engine) as db:
+        db.add_all([
+            Token(id=1, token=f"1:{'a' * 35}", status="verified"),
+            Token(id=2, token=f"2:{'b' * 35}", status="verified"),
+            BotInstance(id=1, token_id=1, is_running=True),
+            BotInstance(id=2, token_id=2, is_running=True, last_swap_at=now - timedelta(hours=1)),
+            # 10: писал второму зеркалу до замены, первому — раньше
+            BotUser(bot_id=1, user_id=10, last_seen=now - timedelta(days=2)),
+            BotUser(bot_id=2, user_id=10, last_seen=now - timedelta(days=1)),
+            # 20: только второе зеркало и только до замены
+            BotUser(bot_id=2, user_id=20, last_seen=now - timedelta(days=1)),
+            # 30: запустил новый токен
+            BotUser(bot_id=2, user_id=30, last_seen=now),
+        ])
+        db.commit()
+
+
+def test_audience_skips_users_who_never_started_the_new_token(temp_db):
+    engine, sessions = temp_db
+    _seed(engine)
+
+    async def run():
+        async with sessions() as db:
+            return await arepo.count_audience(db), await arepo.get_audience_page(db, 0, 100)
+
+    count, page = asyncio.run(run())
+    assert count == 2
+    assert [(u, b) for u, b, _t in page] == [(10, 1), (30, 2)]
+
+
+def test_forbidden_after_swap_is_not_recorded_as_blocked(temp_db):
+    engine, sessions = temp_db
+    _seed(engine)
+    now = datetime.utcnow()
+    states = [
+        {"bot_id": 2, "user_id": 20, "state": "blocked", "state_at": now},
+        {"bot_id": 2, "user_id": 30, "state": "blocked", "state_at": now},
+    ]
+
+    async def run():
+        async with sessions() as db:
+            await arepo.apply_start_batch(db, {}, [], [], states=states)
+
+    asyncio.run(run())
+    with Session(engine) as db:
+        got = dict(db.query(BotUser.user_id, BotUser.state).filter(BotUser.bot_id == 2))
+    assert got == {10: "ok", 20: "ok", 30: "blocked"}
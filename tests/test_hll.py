@@ -0,0 +1,44 @@
+import math
+
+import pytest
+
+from mirrorhub.utils.hll import HyperLogLog
+
+P = 12
+# 3 стандартные ошибки (1.04 / sqrt(2^p)) — граница из комментария в utils/hll.py
+BOUND = 3 * 1.04 / math.sqrt(1 << P)
+
+
+def _sketch(values) -> HyperLogLog:
+    sk = HyperLogLog(P)
+    for v in values:
+        sk.add(v)
+    return sk
+
+
+@pytest.mark.parametrize("n", [100, 10_000, 200_000])
+def test_error_within_documented_bound(n):
+    estimate = _sketch(range(n)).count()
+    assert abs(estimate - n) / n <= BOUND
+
+
+def test_merge_equals_union():
+    a = _sketch(range(0, 60_000))
+    b = _sketch(range(40_000, 100_000))
+    union = _sketch(range(0, 100_000))
+    merged = HyperLogLog(P, a.to_bytes()).merge(b)
+    assert merged.to_bytes() == union.to_bytes()
+    assert merged.count() == union.count()
+
+
+def test_merge_rejects_other_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(12).merge(HyperLogLog(10))
+
+
+def test_bytes_round_trip():
+    sk = _sketch(range(5_000))
+    restored = HyperLogLog.from_bytes(sk.to_bytes())
+    assert restored.p == P
+    assert restored.to_bytes() == sk.to_bytes()
+    assert restored.count() == sk.count()
@@ -0,0 +1,84 @@
+import asyncio
+
+from mirrorhub.core import arepo
+from mirrorhub.core.models import Token
+
+
+def _seed_tokens(engine, n: int):
+    from sqlalchemy.orm import Session
+    with Session(engine) as db:
+        db.add_all(Token(token=f"{100000 + i}:{'x' * 35}", status="verified") for i in range(n))
+        db.commit()
+
+
+async def _claim_concurrently(sessions, calls: int) -> list[list[int]]:
+    async def one():
+        async with sessions() as db:
+            return [t.id for t in await arepo.claim_tokens(db, 1)]
+    return await asyncio.gather(*(one() for _ in range(calls)))
+
+
+def test_concurrent_claims_never_share_a_token(temp_db):
+    engine, sessions = temp_db
+    _seed_tokens(engine, 100)
+
+    results = asyncio.run(_claim_concurrently(sessions, 100))
+    ids = [i for r in results for i in r]
+    assert len(ids) == 100
+    assert len(set(ids)) == 100
+
+    # пул исчерпан: арендованные никому не выдаются
+    assert asyncio.run(_claim_concurrently(sessions, 10)) == [[]] * 10
+
+
+def test_released_tokens_can_be_claimed_again(temp_db):
+    engine, sessions = temp_db
+    _seed_tokens(engine, 100)
+    ids = sorted(i for r in asyncio.run(_claim_concurrently(sessions, 100)) for i in r)
+    returned = ids[:30]
+
+    async def release_and_reclaim():
+        async with sessions() as db:
+            await arepo.release_tokens(db, returned)
+        return await _claim_concurrently(sessions, 100)
+
+    again = [i for r in asyncio.run(release_and_reclaim()) for i in r]
+    assert sorted(again) == returned
+
+
+def test_health_check_does_not_release_a_live_lease(temp_db):
+    engine, sessions = temp_db
+    _seed_tokens(engine, 1)
+
+    async def interleave():
+        from datetime import datetime, timedelta
+        async with sessions() as db:
+            # чекер взял токен в проверку, пока он был свободен
+            todo = await arepo.list_tokens_to_check(db, datetime.utcnow() + timedelta(seconds=1), 10)
+            first = await arepo.claim_tokens(db, 1)
+            # проверка закончилась уже после аренды
+            written = await arepo.set_token_health(db, todo[0][0], "verified", "bot", "https://t.me/bot")
+            second = await arepo.claim_tokens(db, 1)
+        return todo, first, written, second
+
+    todo, first, written, second = asyncio.run(interleave())
+    assert [t for t, _ in todo] == [first[0].id]
+    assert written is False
+    assert second == []
+
+
+def test_lease_owner_can_record_health(temp_db):
+    engine, sessions = temp_db
+    _seed_tokens(engine, 1)
+
+    async def run():
+        async with sessions() as db:
+            [tok] = await arepo.claim_tokens(db, 1)
+            written = await arepo.set_token_health(db, tok.id, "dead", error="Unauthorized", leased=True)
+            again = await arepo.claim_tokens(db, 1)
+        return written, again
+
+    written, again = asyncio.run(run())
+    assert written is True
+    # мёртвый токен не выдаётся, аренда снята вместе с записью статуса
+    assert again == []
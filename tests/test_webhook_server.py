@@ -0,0 +1,78 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot, Router, F
+from aiogram.types import Message
+
+from mirrorhub.mirror_fleet import MirrorFleet
+from mirrorhub.webhook_server import SECRET_HEADER, WebhookServer, secret_for
+
+BOT_ID = 7
+TOKEN = "123456789:" + "A" * 35
+
+
+def _update(text: str) -> dict:
+    return {
+        "update_id": 1,
+        "message": {
+            "message_id": 10,
+            "date": 1700000000,
+            "chat": {"id": 555, "type": "private"},
+            "from": {"id": 555, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+
+def _fleet_with_probe(seen: list):
+    # настоящий общий диспетчер зеркал + роутер, который запоминает, что пришло
+    fleet = MirrorFleet()
+    probe = Router()
+
+    @probe.message(F.text == "webhook probe")
+    async def on_probe(m: Message, bot_id: int):
+        seen.append((bot_id, m.chat.id))
+
+    fleet.dp.include_router(probe)
+    fleet.register(BOT_ID, Bot(TOKEN))
+    return fleet
+
+
+async def _post(fleet: MirrorFleet, path: str, body: dict, secret_header: str | None = None) -> int:
+    client = TestClient(TestServer(WebhookServer(fleet).app))
+    await client.start_server()
+    try:
+        headers = {SECRET_HEADER: secret_header} if secret_header else {}
+        resp = await client.post(path, json=body, headers=headers)
+        # обработка идёт в фоне — дожидаемся её
+        while fleet._handling:
+            await asyncio.gather(*list(fleet._handling))
+        return resp.status
+    finally:
+        await client.close()
+
+
+def test_update_reaches_dispatcher_with_bot_id():
+    seen = []
+    fleet = _fleet_with_probe(seen)
+    secret = secret_for(BOT_ID, TOKEN)
+    status = asyncio.run(_post(fleet, f"/wh/{BOT_ID}/{secret}", _update("webhook probe"), secret))
+    assert status == 200
+    assert seen == [(BOT_ID, 555)]
+
+
+def test_wrong_secret_is_rejected():
+    seen = []
+    fleet = _fleet_with_probe(seen)
+    status = asyncio.run(_post(fleet, f"/wh/{BOT_ID}/not-the-secret", _update("webhook probe")))
+    assert status in (403, 404)
+    assert seen == []
+
+
+def test_unknown_bot_is_rejected():
+    seen = []
+    fleet = _fleet_with_probe(seen)
+    secret = secret_for(BOT_ID + 1, TOKEN)
+    status = asyncio.run(_post(fleet, f"/wh/{BOT_ID + 1}/{secret}", _update("webhook probe"), secret))
+    assert status in (403, 404)
+    assert seen == []
@@ -1,22 +1,36 @@
 
-from aiogram import Bot
-from aiogram.client.default import DefaultBotProperties
-from sqlalchemy.orm import Session
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from aiogram.exceptions import TelegramBadRequest, TelegramNotFound, TelegramUnauthorizedError
 
 from mirrorhub.core.models import BotInstance, Token
-from mirrorhub.core.repo import next_free_token, mark_token_status
-from mirrorhub.config import CENTRAL_BOT_TOKEN, SUPERADMINS
-from mirrorhub.core.db import SessionLocal
+from mirrorhub.core.arepo import (
+    claim_tokens, release_tokens, list_tokens_to_check, set_token_health, assign_bot_token,
+)
+from mirrorhub.config import (
+    CENTRAL_BOT_TOKEN, SUPERADMINS,
+    TOKEN_CHECK_INTERVAL, TOKEN_CHECK_BATCH, TOKEN_CHECK_CONCURRENCY, TOKEN_RECHECK_AFTER, TOKEN_VERIFIED_FRESH,
+    BAN_WAVE_COLLECT_WINDOW, BAN_WAVE_NOTIFY_WINDOW,
+)
+from mirrorhub.core.db import AsyncSessionLocal
 
-from mirrorhub.core.repo import get_setting  # для чтения шаблона
+from mirrorhub.core.settings_cache import settings  # для чтения шаблона
 from mirrorhub.utils.text_tools import replace_link_placeholder
+from mirrorhub.http_pool import make_bot
+from mirrorhub.broadcast import BroadcastStats, run_audience_broadcast
+from mirrorhub.send_limiter import PRIORITY_REPLACEMENT
+from mirrorhub.core.write_behind import bookkeeping
+
+log = logging.getLogger(__name__)
 
 REPLACE_NOTIFY_TEMPLATE_KEY = "replace_notify_text"
 REPLACE_NOTIFY_DEFAULT = "Новые контакты:\n*Ссылка*"
 
 async def _notify_superadmins(text: str):
     try:
-        bot = Bot(CENTRAL_BOT_TOKEN, default=DefaultBotProperties())
+        bot = make_bot(CENTRAL_BOT_TOKEN, parse_mode=None)
         for admin_id in SUPERADMINS:
             try:
                 await bot.send_message(admin_id, text, parse_mode="HTML")
@@ -26,90 +40,217 @@ async def _notify_superadmins(text: str):
     except Exception:
         pass
 
-async def probe_token(bot_token: str) -> tuple[bool, str | None, str | None]:
+async def check_token(bot_token: str) -> tuple[str, str | None, str | None, str | None]:
+    # -> (status, username, link, error); status: verified / banned / dead / unknown
+    bot = make_bot(bot_token, parse_mode=None)
     try:
-        bot = Bot(bot_token, default=DefaultBotProperties())
         me = await bot.get_me()
-        username = me.username or ""
-        link = f"https://t.me/{username}" if username else ""
-        await bot.session.close()
-        return True, username, link
+    except TelegramUnauthorizedError as e:
+        return "banned", None, None, f"{type(e).__name__}: {e}"
+    except (TelegramNotFound, TelegramBadRequest) as e:
+        return "dead", None, None, f"{type(e).__name__}: {e}"
     except Exception as e:
-        return False, None, f"{type(e).__name__}: {e}"
+        # сеть/сервер Telegram — о самом токене ничего не известно
+        return "unknown", None, None, f"{type(e).__name__}: {e}"
+    finally:
+        await bot.session.close()
+    username = me.username or ""
+    link = f"https://t.me/{username}" if username else ""
+    return "verified", username, link, None
+
+async def check_free_tokens_once(limit: int = TOKEN_CHECK_BATCH) -> dict[str, int]:
+    checked_before = datetime.utcnow() - timedelta(seconds=TOKEN_RECHECK_AFTER)
+    async with AsyncSessionLocal() as db:
+        todo = await list_tokens_to_check(db, checked_before, limit)
+
+    sem = asyncio.Semaphore(TOKEN_CHECK_CONCURRENCY)
+    counts: dict[str, int] = {}
 
-async def _broadcast_replacement_to_running_bots(new_bot_link: str, text_html: str):
-    from aiogram.types import FSInputFile  # не используется (на будущее)
-    from mirrorhub.core.repo import list_bots, get_bot_users
-    from mirrorhub.core.models import Token as TokenModel
+    async def one(token_id: int, token: str):
+        async with sem:
+            status, username, link, error = await check_token(token)
+        counts[status] = counts.get(status, 0) + 1
+        if status == "unknown":
+            return
+        async with AsyncSessionLocal() as db:
+            await set_token_health(db, token_id, status, username, link, error)
 
-    with SessionLocal() as db:
-        bots = [b for b in list_bots(db) if b.is_running]
+    await asyncio.gather(*(one(i, t) for i, t in todo))
+    return counts
 
+async def token_health_loop():
+    while True:
+        try:
+            counts = await check_free_tokens_once()
+            if counts:
+                log.info("Token health check: %s", counts)
+        except Exception:
+            log.exception("Token health check failed")
+        await asyncio.sleep(TOKEN_CHECK_INTERVAL)
+
+async def _broadcast_replacement_to_running_bots(text_html: str) -> BroadcastStats:
+    # один человек — одно сообщение, через зеркало, с которым он общался последним;
+    # токены рассылают параллельно, каждый в своих лимитах
+    await bookkeeping.flush()
+    stats = await run_audience_broadcast(text_html, None, priority=PRIORITY_REPLACEMENT)
+    await _notify_superadmins(
+        f"📨 Уведомление о замене: доставлено {stats.ok} из {stats.total}, ошибок {stats.fail}"
+    )
+    return stats
 
-    if not bots:
-        return
+_BACKGROUND: set[asyncio.Task] = set()
 
+def _in_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _BACKGROUND.add(task)
+    task.add_done_callback(_BACKGROUND.discard)
+    return task
 
-    for b in bots:
-        with SessionLocal() as db:
-            tok_obj = db.get(TokenModel, b.token_id) if b.token_id else None
-            users = get_bot_users(db, b.id)
+async def allocate_tokens(count: int) -> tuple[list[tuple[Token, str, str]], str | None]:
+    # -> ([(token, username, link)], причина нехватки); токены арендуются атомарно,
+    # так что параллельные вызовы никогда не получат один и тот же токен
+    granted: list[tuple[Token, str, str]] = []
+    while len(granted) < count:
+        async with AsyncSessionLocal() as db:
+            batch = await claim_tokens(db, count - len(granted))
+        if not batch:
+            return granted, "Пул пуст"
 
-        if not tok_obj or not users:
+        stale: list[Token] = []
+        now = datetime.utcnow()
+        for t in batch:
+            fresh = (
+                t.status == "verified"
+                and t.checked_at is not None
+                and now - t.checked_at < timedelta(seconds=TOKEN_VERIFIED_FRESH)
+            )
+            if fresh:
+                granted.append((t, t.username or "", t.link or ""))
+            else:
+                stale.append(t)
+        if not stale:
             continue
 
-        cli = Bot(token=tok_obj.token)
+        # сессия БД не держится открытой, пока идёт getMe
+        sem = asyncio.Semaphore(TOKEN_CHECK_CONCURRENCY)
+
+        async def _check(t: Token):
+            async with sem:
+                return await check_token(t.token)
+
+        results = await asyncio.gather(*(_check(t) for t in stale))
+        unreachable: list[int] = []
+        unreachable_error = None
+        for t, (status, username, link, error) in zip(stale, results):
+            if status == "verified":
+                granted.append((t, username or "", link or ""))
+            elif status == "unknown":
+                unreachable.append(t.id)
+                unreachable_error = unreachable_error or error
+            else:
+                async with AsyncSessionLocal() as db:
+                    await set_token_health(db, t.id, status, error=error, leased=True)
+        if unreachable:
+            # нет связи с Telegram — не хороним весь пул, возвращаем аренду и пробуем позже
+            async with AsyncSessionLocal() as db:
+                await release_tokens(db, unreachable)
+            return granted, unreachable_error
+    return granted, None
+
+class BanWave:
+    # Баны, пришедшие почти одновременно, заменяются одной пачкой токенов;
+    # пользователи и суперадмины получают по одному сводному сообщению на волну.
+    def __init__(self, collect: float = BAN_WAVE_COLLECT_WINDOW, notify_window: float = BAN_WAVE_NOTIFY_WINDOW):
+        self.collect = collect
+        self.notify_window = notify_window
+        self._queue: dict[int, tuple[int | None, asyncio.Future]] = {}
+        self._batch_task: asyncio.Task | None = None
+        self._replaced: list[tuple[int, int | None, int, str, str]] = []
+        self._failed: list[tuple[int, str]] = []
+        self._notify_task: asyncio.Task | None = None
+
+    async def replace(self, bot_id: int, banned_old_token_id: int | None = None) -> tuple[bool, str]:
+        queued = self._queue.get(bot_id)
+        if queued is None:
+            queued = (banned_old_token_id, asyncio.get_running_loop().create_future())
+            self._queue[bot_id] = queued
+        if self._batch_task is None:
+            self._batch_task = _in_background(self._run_batch())
+        return await asyncio.shield(queued[1])
+
+    async def _run_batch(self):
+        await asyncio.sleep(self.collect)
+        batch, self._queue = self._queue, {}
+        # баны, пришедшие во время обработки, соберутся в следующую пачку
+        self._batch_task = None
         try:
-            for u in users:
-                try:
-                    await cli.send_message(chat_id=u.user_id, text=text_html, parse_mode="HTML")
-                except Exception:
-                    pass
-        finally:
-            await cli.session.close()
-
-async def replace_dead_token(db: Session, bot_id: int, banned_old_token_id: int | None = None):
-    token_row = next_free_token(db)
-    if not token_row:
-        bot = db.get(BotInstance, bot_id)
-        if bot:
-            bot.is_running = False
-            bot.last_error = "Нет свободных токенов в пуле"
-            db.commit()
-        await _notify_superadmins(f"⚠️ Бот #{bot_id}: нет свободных токенов для замены.")
-        return False, "Пул пуст"
-
-    ok, username, link = await probe_token(token_row.token)
-    if not ok:
-        mark_token_status(db, token_row.id, "dead")
-        return await replace_dead_token(db, bot_id, banned_old_token_id=banned_old_token_id)
-
-    bot = db.get(BotInstance, bot_id)
-    if not bot:
-        return False, "BotInstance not found"
-
-
-    bot.token_id = token_row.id
-    bot.username = username or ""
-    bot.link = link or ""
-    bot.is_running = True
-    bot.last_error = None
-    mark_token_status(db, token_row.id, "in_use")
-    db.commit()
-
-
-    info_old = f" (старый token_id={banned_old_token_id})" if banned_old_token_id else ""
-    await _notify_superadmins(
-        f"🚨 Бот #{bot_id}: токен забанен{info_old}. "
-        f"Подключён новый token_id={token_row.id} → @{bot.username or '—'} {bot.link or ''}"
-    )
+            granted, reason = await allocate_tokens(len(batch))
+        except Exception as e:
+            log.exception("Token allocation failed")
+            granted, reason = [], f"{type(e).__name__}: {e}"
+
+        items = list(batch.items())
+        results = await asyncio.gather(
+            *(
+                self._apply(bot_id, old_id, granted[i] if i < len(granted) else None, reason)
+                for i, (bot_id, (old_id, _fut)) in enumerate(items)
+            ),
+            return_exceptions=True,
+        )
+        for (bot_id, (_old, fut)), res in zip(items, results):
+            if isinstance(res, BaseException):
+                res = (False, f"{type(res).__name__}: {res}")
+            if not fut.done():
+                fut.set_result(res)
+
+        if self._notify_task is None:
+            self._notify_task = _in_background(self._notify_later())
+
+    async def _apply(self, bot_id: int, old_token_id: int | None, grant, reason: str | None) -> tuple[bool, str]:
+        if grant is None:
+            pool_empty = reason == "Пул пуст"
+            async with AsyncSessionLocal() as db:
+                bot = await db.get(BotInstance, bot_id)
+                if bot:
+                    bot.is_running = False
+                    bot.last_error = "Нет свободных токенов в пуле" if pool_empty else f"Замена не удалась: {reason}"
+                    await db.commit()
+            self._failed.append((bot_id, "нет свободных токенов" if pool_empty else f"не удалось проверить токен ({reason})"))
+            return False, reason or ""
+
+        token_row, username, link = grant
+        async with AsyncSessionLocal() as db:
+            if not await assign_bot_token(db, bot_id, token_row.id, username, link):
+                await release_tokens(db, [token_row.id])
+                return False, "BotInstance not found"
+        self._replaced.append((bot_id, old_token_id, token_row.id, username, link))
+        return True, username or ""
+
+    async def _notify_later(self):
+        # ждём, пока волна уляжется: 10 банов за минуту — одно сообщение, а не 10
+        await asyncio.sleep(self.notify_window)
+        replaced, self._replaced = self._replaced, []
+        failed, self._failed = self._failed, []
+        self._notify_task = None
+
+        if replaced or failed:
+            lines = [f"🚨 Волна банов: заменено {len(replaced)}, не удалось {len(failed)}"]
+            for bot_id, old_id, new_id, username, link in replaced:
+                info_old = f" (старый token_id={old_id})" if old_id else ""
+                lines.append(f"#{bot_id}{info_old} → token_id={new_id} @{username or '—'} {link}")
+            for bot_id, why in failed:
+                lines.append(f"⚠️ #{bot_id}: {why}")
+            await _notify_superadmins("\n".join(lines))
 
+        links = [link for _b, _o, _n, _u, link in replaced if link]
+        if links:
+            tmpl = settings.get(REPLACE_NOTIFY_TEMPLATE_KEY) or REPLACE_NOTIFY_DEFAULT
+            links_text = "\n".join(links)
+            await _broadcast_replacement_to_running_bots(replace_link_placeholder(tmpl, links_text))
 
-    with SessionLocal() as sdb:
-        tmpl = get_setting(sdb, REPLACE_NOTIFY_TEMPLATE_KEY) or REPLACE_NOTIFY_DEFAULT
-    link_text = bot.link or "(ссылка недоступна)"
-    text_html = replace_link_placeholder(tmpl, link_text)
 
+ban_wave = BanWave()
 
-    await _broadcast_replacement_to_running_bots(link_text, text_html)
-    return True, username or ""
+async def replace_dead_token(bot_id: int, banned_old_token_id: int | None = None):
+    # замена попадает в текущую волну; уведомления уходят сводкой в фоне и не удлиняют простой
+    return await ban_wave.replace(bot_id, banned_old_token_id)
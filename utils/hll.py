@@ -0,0 +1,67 @@
+import hashlib
+import math
+
+# HyperLogLog: приблизительное число уникальных с постоянной памятью (2^p байт на скетч).
+# Стандартная ошибка ≈ 1.04 / sqrt(2^p): p=12 (4 КиБ) — ≈1.6%, т.е. ~95% оценок
+# укладываются в ±3.3%, ~99.7% — в ±4.9%. Пока оценка меньше 2.5·2^p, работает
+# linear counting — там ошибка заметно меньше (на сотнях пользователей почти точно).
+# Скетчи объединяются без потерь: merge(A, B) == скетч(A ∪ B).
+
+_HIGH_BITS_CACHE: dict[int, tuple[int, int]] = {}
+
+
+def _masks(n: int) -> tuple[int, int]:
+    # 0x80 и 0x01 в каждом из n байт — для побайтового max без цикла по регистрам
+    masks = _HIGH_BITS_CACHE.get(n)
+    if masks is None:
+        masks = (int.from_bytes(b"\x80" * n, "big"), int.from_bytes(b"\x01" * n, "big"))
+        _HIGH_BITS_CACHE[n] = masks
+    return masks
+
+
+def _bytewise_max(a: bytes, b: bytes) -> bytes:
+    # регистры ≤ 64 < 128, поэтому (a | 0x80) - b не заимствует между байтами:
+    # старший бит каждого байта остаётся 1 ровно там, где a >= b
+    n = len(a)
+    high, low = _masks(n)
+    x, y = int.from_bytes(a, "big"), int.from_bytes(b, "big")
+    ge = (((x | high) - y) & high) >> 7
+    mask = ge * 0xFF
+    return ((x & mask) | (y & ~mask & (low * 0xFF))).to_bytes(n, "big")
+
+
+class HyperLogLog:
+    def __init__(self, p: int = 12, registers: bytes | None = None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "HyperLogLog":
+        return cls(int(math.log2(len(blob))), blob)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+    def add(self, value) -> None:
+        h = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+        idx = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.p != self.p:
+            raise ValueError("HLL precision mismatch")
+        self.registers = bytearray(_bytewise_max(bytes(self.registers), bytes(other.registers)))
+        return self
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
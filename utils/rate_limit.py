@@ -0,0 +1,104 @@
+import asyncio
+import time
+from collections import deque
+from typing import Sequence
+
+
+# token bucket: rate отправок в секунду, не больше capacity подряд
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        # Telegram прислал retry_after — весь токен молчит указанное время
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# не чаще одного сообщения в interval секунд в один чат
+class ChatThrottle:
+    def __init__(self, interval: float = 1.0, max_keys: int = 50_000):
+        self.interval = interval
+        self.max_keys = max_keys
+        self._next: dict[int, float] = {}
+
+    async def wait(self, chat_id: int):
+        now = time.monotonic()
+        slot = max(now, self._next.get(chat_id, 0.0))
+        self._next[chat_id] = slot + self.interval
+        if len(self._next) > self.max_keys:
+            self._prune(now)
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def _prune(self, now: float):
+        self._next = {k: v for k, v in self._next.items() if v > now}
+
+
+# token bucket с классами приоритета (0 — самый важный). Очередной слот получает
+# непустой класс с наименьшим пройденным путём (stride scheduling): путь растёт на
+# 1/вес за слот, поэтому старшие классы обслуживаются чаще, а младшие не голодают.
+class PriorityBucket:
+    def __init__(self, rate: float, weights: Sequence[float], capacity: float | None = None):
+        self.bucket = TokenBucket(rate, capacity)
+        self.weights = list(weights)
+        self._queues: list[deque[asyncio.Future]] = [deque() for _ in self.weights]
+        self._pass = [0.0] * len(self.weights)
+        self._pump: asyncio.Task | None = None
+
+    def pause(self, seconds: float):
+        self.bucket.pause(seconds)
+
+    def waiting(self) -> list[int]:
+        return [sum(1 for f in q if not f.done()) for q in self._queues]
+
+    async def acquire(self, priority: int):
+        q = self._queues[priority]
+        if not q:
+            # класс простаивал — не даём ему накопленного преимущества
+            busy = [self._pass[i] for i, other in enumerate(self._queues) if other]
+            if busy:
+                self._pass[priority] = max(self._pass[priority], min(busy))
+        fut = asyncio.get_running_loop().create_future()
+        q.append(fut)
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run())
+        # при отмене ожидающего future отменяется и просто пропускается раздачей
+        await fut
+
+    def _next(self) -> int | None:
+        best = None
+        for i, q in enumerate(self._queues):
+            while q and q[0].done():
+                q.popleft()
+            if q and (best is None or self._pass[i] < self._pass[best]):
+                best = i
+        return best
+
+    async def _run(self):
+        while self._next() is not None:
+            await self.bucket.acquire()
+            # выбираем после ожидания слота: за это время мог прийти более важный запрос
+            i = self._next()
+            if i is None:
+                return
+            self._pass[i] += 1 / self.weights[i]
+            self._queues[i].popleft().set_result(None)
@@ -0,0 +1,79 @@
+import hashlib
+import hmac
+import logging
+import secrets
+
+from aiohttp import web
+from aiogram.types import Update
+
+from mirrorhub.config import (
+    MIRROR_WEBHOOK_BASE_URL,
+    MIRROR_WEBHOOK_HOST,
+    MIRROR_WEBHOOK_PORT,
+    MIRROR_WEBHOOK_SECRET,
+)
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# без заданного секрета генерируем свой на процесс — вебхуки всё равно
+# перерегистрируются при каждом старте зеркал
+_KEY = (MIRROR_WEBHOOK_SECRET or secrets.token_urlsafe(32)).encode()
+
+
+def secret_for(bot_id: int, token: str) -> str:
+    # секрет зависит от токена: после замены токена старый URL перестаёт работать
+    return hmac.new(_KEY, f"{bot_id}:{token}".encode(), hashlib.sha256).hexdigest()[:48]
+
+
+def webhook_url(bot_id: int, token: str) -> str:
+    return f"{MIRROR_WEBHOOK_BASE_URL.rstrip('/')}/wh/{bot_id}/{secret_for(bot_id, token)}"
+
+
+class WebhookServer:
+    # Один aiohttp-сервер на всё зеркальное хозяйство: путь /wh/<bot_id>/<secret>
+    def __init__(self, fleet, host: str = MIRROR_WEBHOOK_HOST, port: int = MIRROR_WEBHOOK_PORT):
+        self.fleet = fleet
+        self.host = host
+        self.port = port
+        self.app = web.Application()
+        self.app.router.add_post("/wh/{bot_id}/{secret}", self.handle)
+        self._runner: web.AppRunner | None = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        try:
+            bot_id = int(request.match_info["bot_id"])
+        except ValueError:
+            return web.Response(status=404)
+        bot = self.fleet.get_bot(bot_id)
+        if bot is None:
+            return web.Response(status=404)
+
+        expected = secret_for(bot_id, bot.token)
+        if not hmac.compare_digest(request.match_info["secret"], expected):
+            return web.Response(status=403)
+        header = request.headers.get(SECRET_HEADER)
+        if header is not None and not hmac.compare_digest(header, expected):
+            return web.Response(status=403)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": bot})
+        except Exception:
+            return web.Response(status=400)
+
+        # отвечаем Telegram сразу, обработка идёт в фоне
+        self.fleet.dispatch(bot, update)
+        return web.Response()
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        log.info("Mirror webhook server listening on %s:%s", self.host, self.port)
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None